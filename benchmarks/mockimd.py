@@ -0,0 +1,208 @@
+"""Local stand-in for the IMD real time data server, used by the tests and the
+benchmarks.
+
+Every parameter of imddaily is served under the same folder as on the IMD
+server, with synthetic .grd files of the real grid size for any date. Latency
+and a failure rate mimic a slow or overloaded server, and single files can be
+made missing (404), truncated, flaky (503 before success) or changed (ETag).
+The grids are defined here and not read from imddaily so that any version of
+the package can be run against the server.
+
+    python benchmarks/mockimd.py --port 8000 --latency 0.05 --failure-rate 0.1
+"""
+import argparse, random, threading, time, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set, Tuple
+import numpy as np
+
+# folder on the server -> parameter, rows, columns and no data value
+GRIDS: Dict[str, Tuple[str, int, int, float]] = {
+    "gpm": ("raingpm", 281, 241, -999.0),
+    "max": ("tmax", 61, 61, 99.9),
+    "min": ("tmin", 61, 61, 99.9),
+    "Rainfall": ("rain", 129, 135, -999.0),
+    "maxone": ("tmaxone", 31, 31, 99.9),
+    "minone": ("tminone", 31, 31, 99.9),
+}
+
+
+def grid(folder: str, name: str, land: bool = True) -> np.ndarray:
+    """synthetic grid of a parameter in the stored (south to north) order, a
+    smooth field with noise and an elliptic land mask of no data values so
+    that compression behaves like on the real data
+
+    Args:
+        folder (str): folder of the parameter on the server
+        name (str): file name, seeds the field so every day differs
+        land (bool, optional): mask the cells outside the land with no data. Defaults to True.
+
+    Returns:
+        np.ndarray: flat float32 array of the grd file
+    """
+    _, lat, lon, undef = GRIDS[folder]
+    seed = zlib.crc32(name.encode())
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[-1 : 1 : lat * 1j, -1 : 1 : lon * 1j]
+    phase = (seed % 360) / 57.3
+    field = 20 + 10 * np.sin(3 * x + phase) * np.cos(2 * y - phase)
+    field += rng.normal(0, 1, field.shape)
+    if land:
+        field = np.where(x**2 / 0.8 + y**2 / 0.9 <= 1, field, undef)
+    return field.astype("float32").ravel()
+
+
+class MockIMD(ThreadingHTTPServer):
+    """threaded HTTP server of synthetic grd files. The attributes configuring
+    single files and the request counters can be changed and read while the
+    server runs.
+
+    Args:
+        port (int, optional): port to listen on, 0 for a free port. Defaults to 0.
+        latency (float, optional): seconds to wait before each response. Defaults to 0.
+        failure_rate (float, optional): fraction of requests answered with 503. Defaults to 0.
+        seed (Optional[int]): seed of the failures, defaults to None.
+        land (bool, optional): mask the grids outside the land with no data. Defaults to True.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self, port: int = 0, latency: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None,
+        land: bool = True,
+    ) -> None:
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.land = land
+        self.missing: Set[str] = set()  # file names answered with 404
+        self.short: Set[str] = set()  # file names answered with a truncated body
+        self.flaky: Dict[str, int] = {}  # file name -> number of 503 responses before success
+        self.version = 0  # bump to change the ETag of every file
+        self.requests = 0  # GET and HEAD requests
+        self.failures = 0  # requests failed by failure_rate
+        self.hits: Dict[str, int] = {}  # file name -> number of GET requests
+        self.sent: Dict[str, int] = {}  # file name -> number of full responses
+        self.heads: Dict[str, int] = {}  # file name -> number of HEAD requests
+        self.active = 0  # GET requests being answered
+        self.peak = 0  # maximum of active
+        self.lock = threading.Lock()
+        self.__random = random.Random(seed)
+        self.__cache: Dict[str, bytes] = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def grid(self, folder: str, name: str) -> np.ndarray:
+        """grid served for the file, see grid"""
+        return grid(folder, name, self.land)
+
+    def fail(self) -> bool:
+        """count a request and draw whether it fails"""
+        with self.lock:
+            self.requests += 1
+            failed = self.__random.random() < self.failure_rate
+            self.failures += failed
+        return failed
+
+    def body(self, folder: str, name: str) -> bytes:
+        """bytes of a grd file, cached so the server is not the bottleneck"""
+        with self.lock:
+            data = self.__cache.get(name)
+        if data is None:
+            data = self.grid(folder, name).tobytes()
+            with self.lock:
+                self.__cache[name] = data
+        return data
+
+    def start(self) -> "MockIMD":
+        """serve on a background thread"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes on a keep-alive connection, with
+    # Nagle's algorithm the body waits for the delayed ACK of the headers
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        server: MockIMD = self.server
+        folder, _, name = self.path.strip("/").partition("/")
+        with server.lock:
+            server.heads[name] = server.heads.get(name, 0) + 1
+        if server.fail():
+            self.send_error(503)
+            return
+        if folder not in GRIDS or not name.endswith(".grd") or name in server.missing:
+            self.send_error(404)
+            return
+        _, lat, lon, _ = GRIDS[folder]
+        self.send_response(200)
+        self.send_header("Content-Length", str(lat * lon * 4))
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        server: MockIMD = self.server
+        folder, _, name = self.path.strip("/").partition("/")
+        with server.lock:
+            server.hits[name] = server.hits.get(name, 0) + 1
+            fails = server.flaky.get(name, 0)
+            if fails:
+                server.flaky[name] = fails - 1
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+            if server.fail() or fails:
+                self.send_error(503)
+                return
+            self.__respond(server, folder, name)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def __respond(self, server: MockIMD, folder: str, name: str) -> None:
+        if folder not in GRIDS or not name.endswith(".grd") or name in server.missing:
+            self.send_error(404)
+            return
+        etag = f'"{server.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = server.body(folder, name)
+        if name in server.short:
+            body = body[:100]
+        with server.lock:
+            server.sent[name] = server.sent.get(name, 0) + 1
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockIMD(args.port, args.latency, args.failure_rate)
+    print(f"serving {', '.join(p for p, *_ in GRIDS.values())} on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
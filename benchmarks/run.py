@@ -0,0 +1,232 @@
+"""Benchmarks of the download and conversion hot paths of imddaily against the
+local mock IMD server in benchmarks/mockimd.py.
+
+Each case runs in a fresh process so its peak resident memory is its own. The
+results are written as JSON with the imddaily version and git commit so runs
+of different versions can be compared, --compare exits with 1 when a case got
+slower than the threshold allows. The keyword arguments of get_data and
+to_geotiff are passed only where the benchmarked version has them, so the
+runner works from v0.3.0 on; cases a version cannot run, like the async
+engine, are skipped.
+
+    git worktree add /tmp/imddaily-0.3.0 v0.3.0
+    python benchmarks/run.py --package-path /tmp/imddaily-0.3.0 --output v0.3.0.json
+    python benchmarks/run.py --compare v0.3.0.json --threshold 0.1
+"""
+import argparse, importlib, inspect, json, os, platform, subprocess, sys, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from datetime import timedelta as td
+import multiprocessing as mp
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from mockimd import MockIMD
+
+# source tree of the imddaily to benchmark, read from the environment so the
+# spawned case processes import the same tree as the runner
+PACKAGE_PATH = os.environ.setdefault(
+    "IMDDAILY_BENCH_PATH", os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, PACKAGE_PATH)
+START = datetime(2020, 6, 1)
+
+
+def _imddaily() -> Any:
+    """imddaily module of the benchmarked tree"""
+    return importlib.import_module("imddaily.imddaily")
+
+
+def _supported(func: Any, **kwargs: Any) -> Dict[str, Any]:
+    """keyword arguments the function of the benchmarked version accepts"""
+    params = inspect.signature(func).parameters
+    return {k: v for k, v in kwargs.items() if k in params}
+
+
+def _get_data(url: str, param: str, days: int, path: str, **kwargs: Any) -> Any:
+    imddaily = _imddaily()
+    if "base_url" not in inspect.signature(imddaily.get_data).parameters:
+        # versions without base_url hold the full url of every parameter
+        from imddaily.core import IMD
+
+        urls = IMD._IMD__IMDURL
+        for p, u in urls.items():
+            urls[p] = f"{url}{u.rstrip('/').rsplit('/', 1)[1]}/"
+    kwargs = _supported(imddaily.get_data, base_url=url, **kwargs)
+    return imddaily.get_data(param, f"{START:%Y-%m-%d}", _end(days), path, True, **kwargs)
+
+
+def _commit(path: str) -> Optional[str]:
+    """short git commit of the tree, with '+' when it has uncommitted changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "-C", path, "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "-C", path, "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + "+" * bool(dirty)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _end(days: int) -> str:
+    return f"{START + td(days=days - 1):%Y-%m-%d}"
+
+
+def _download_case(url: str, param: str, days: int, workers: int, engine: str) -> Tuple[float, float, Optional[float]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        t = time.perf_counter()
+        data = _get_data(url, param, days, tmp, pool_size=workers, backoff=0, engine=engine)
+        elapsed = time.perf_counter() - t
+    return (len(data) / elapsed, elapsed, _peak_rss_mb())
+
+
+def _convert_case(url: str, param: str, days: int, workers: int, single: bool) -> Tuple[float, float, Optional[float]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        data = _get_data(url, param, days, tmp)
+        size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+        out = os.path.join(tmp, "tif")
+        os.mkdir(out)
+        t = time.perf_counter()
+        data.to_geotiff(out, single=single, **_supported(data.to_geotiff, workers=workers))
+        elapsed = time.perf_counter() - t
+    return (size / 2**20 / elapsed, elapsed, _peak_rss_mb())
+
+
+def _run_case(func: Any, *args: Any) -> Tuple[float, float, Optional[float]]:
+    with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as ex:
+        return ex.submit(func, *args).result()
+
+
+def run(
+    params: List[str], days: int, workers: List[int], latency: float, failure_rate: float,
+    repeat: int = 3,
+) -> Dict[str, Any]:
+    """run all the cases, each case repeated and the best run kept
+
+    Args:
+        params (List[str]): parameters to benchmark
+        days (int): number of days of each case
+        workers (List[int]): worker counts to measure the scaling with
+        latency (float): seconds of latency of the mock server
+        failure_rate (float): fraction of requests failing with 503
+        repeat (int, optional): runs of each case. Defaults to 3.
+
+    Returns:
+        Dict[str, Any]: environment, configuration and results
+    """
+    imddaily = _imddaily()
+    engines = ["thread"]
+    if "engine" in inspect.signature(imddaily.get_data).parameters:
+        engines.append("async")
+    server = MockIMD(latency=latency, failure_rate=failure_rate, seed=0).start()
+    results = {}
+    try:
+        for param in params:
+            cases = []
+            for w in workers:
+                for engine in engines:
+                    cases.append((f"download/{engine}/{param}/w{w}", "files/s", _download_case, engine))
+                cases.append((f"geotiff/daily/{param}/w{w}", "MB/s", _convert_case, False))
+                cases.append((f"geotiff/single/{param}/w{w}", "MB/s", _convert_case, True))
+            for name, unit, func, arg in cases:
+                w = int(name.rsplit("/w", 1)[1])
+                runs = [_run_case(func, server.url, param, days, w, arg) for _ in range(repeat)]
+                value, seconds, rss = max(runs, key=lambda r: r[0])
+                results[name] = {
+                    "value": round(value, 3), "unit": unit, "seconds": round(seconds, 4),
+                    "peak_rss_mb": round(max(r[2] for r in runs), 1) if rss is not None else None,
+                }
+                print(f"{name:<36} {value:10.2f} {unit:<8} {results[name]['peak_rss_mb']} MB", flush=True)
+    finally:
+        server.stop()
+    return {
+        "version": imddaily.__version__,
+        "commit": _commit(os.path.dirname(os.path.dirname(os.path.abspath(imddaily.__file__)))),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "date": f"{datetime.now():%Y-%m-%d %H:%M}",
+        "config": {"params": params, "days": days, "workers": workers,
+                   "latency": latency, "failure_rate": failure_rate, "repeat": repeat},
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """cases of both runs whose throughput dropped by more than the threshold
+
+    Args:
+        current (Dict[str, Any]): output of run
+        baseline (Dict[str, Any]): output of an earlier run
+        threshold (float): allowed relative drop, 0.1 for 10 %
+
+    Returns:
+        List[str]: names of the regressed cases
+    """
+    if current["config"] != baseline["config"]:
+        print("warning: configurations differ, results may not be comparable")
+    regressed = []
+    old_name, new_name = (f"{r['version']}@{r.get('commit') or '?'}" for r in (baseline, current))
+    print(f"\n{'case':<36} {old_name:>16} {new_name:>16}   change")
+    for name, res in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            continue
+        change = res["value"] / old["value"] - 1 if old["value"] else 0.0
+        flag = change < -threshold
+        regressed += [name] * flag
+        print(f"{name:<36} {old['value']:16.2f} {res['value']:16.2f} {change:+8.1%}{'  REGRESSION' if flag else ''}")
+    return regressed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="imddaily download and conversion benchmarks")
+    parser.add_argument("--params", default="rain,tmax", help="comma separated parameters")
+    parser.add_argument("--days", type=int, default=60, help="days in each case")
+    parser.add_argument("--workers", default="1,4,16", help="comma separated worker counts")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds of latency of each response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each case, the best is kept")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+    parser.add_argument(
+        "--package-path", default=PACKAGE_PATH, help="source tree of the imddaily version to benchmark"
+    )
+    args = parser.parse_args(argv)
+    if os.path.abspath(args.package_path) != os.path.abspath(PACKAGE_PATH):
+        # the tree is read on import, run again so every process imports it
+        env = dict(os.environ, IMDDAILY_BENCH_PATH=os.path.abspath(args.package_path))
+        return subprocess.call([sys.executable, os.path.abspath(__file__), *sys.argv[1:]], env=env)
+    result = run(
+        args.params.split(","), args.days, [int(w) for w in args.workers.split(",")],
+        args.latency, args.failure_rate, args.repeat,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(result, json.load(f), args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} case(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""Single pass temporal aggregation of the daily grids into monthly, seasonal or
+annual statistics, climatologies and anomalies. The days are streamed once
+through running accumulators so memory does not grow with the number of years.
+
+Raises:
+    ValueError: frequency or statistic is not recognized
+"""
+from datetime import datetime
+from itertools import groupby
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+import numpy as np
+
+STATS = ("sum", "mean", "min", "max", "std", "count")
+_MONTHS = "JFMAMJJASOND"
+
+
+def period(freq: str) -> Callable[[datetime], Optional[Tuple[str, str]]]:
+    """function giving the label of the period of a date and its slot in the
+    climatology for the frequency
+
+    'D' daily (label YYYYMMDD, slot MMDD), 'M' monthly (label YYYYMM, slot MM),
+    'Y' annual (label YYYY, slot Y) or a season as consecutive month initials
+    like 'JJAS' or 'DJF' (label YYYY<season> with the year of the last month,
+    slot <season>)
+
+    Args:
+        freq (str): frequency of the periods
+
+    Raises:
+        ValueError: frequency is not recognized
+
+    Returns:
+        Callable[[datetime], Optional[Tuple[str, str]]]: label and slot of a date,
+        None for dates outside the season
+    """
+    if freq == "D":
+        return lambda d: (f"{d:%Y%m%d}", f"{d:%m%d}")
+    if freq == "M":
+        return lambda d: (f"{d:%Y%m}", f"{d:%m}")
+    if freq == "Y":
+        return lambda d: (f"{d:%Y}", "Y")
+    start = (_MONTHS * 2).find(freq)
+    if not 2 <= len(freq) <= 11 or start < 0:
+        raise ValueError(f"{freq} frequency is not available. ('D', 'M', 'Y' or a season like 'JJAS')")
+    months = [(start + i) % 12 + 1 for i in range(len(freq))]
+    wraps = start + len(freq) > 12
+
+    def season(d: datetime) -> Optional[Tuple[str, str]]:
+        if d.month not in months:
+            return None
+        year = d.year + 1 if wraps and d.month >= months[0] else d.year
+        return (f"{year}{freq}", freq)
+
+    return season
+
+
+class Accumulator:
+    """running count, sum, minimum, maximum and Welford mean and variance of
+    grids, leaving out the no data values
+
+    Args:
+        shape (Tuple[int, ...]): shape of the grids
+        nodata (float): no data value of the grids
+    """
+
+    def __init__(self, shape: Tuple[int, ...], nodata: float) -> None:
+        self.nodata = np.float32(nodata)
+        self.count = np.zeros(shape, "int32")
+        self.mean = np.zeros(shape, "float64")
+        self.m2 = np.zeros(shape, "float64")
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    def add(self, arr: np.ndarray) -> None:
+        """add a grid to the accumulator
+
+        Args:
+            arr (np.ndarray): grid with the no data value for missing pixels
+        """
+        valid = arr != self.nodata
+        x = np.where(valid, arr, 0).astype("float64")
+        self.count += valid
+        delta = np.where(valid, x - self.mean, 0)
+        self.mean += delta / np.maximum(self.count, 1)
+        self.m2 += delta * np.where(valid, x - self.mean, 0)
+        np.minimum(self.min, np.where(valid, x, np.inf), out=self.min)
+        np.maximum(self.max, np.where(valid, x, -np.inf), out=self.max)
+
+    def result(self, stat: str) -> np.ndarray:
+        """statistic of the accumulated grids
+
+        Args:
+            stat (str): one of 'sum', 'mean', 'min', 'max', 'std' (sample) or 'count'
+
+        Raises:
+            ValueError: statistic is not recognized
+
+        Returns:
+            np.ndarray: float32 grid with the no data value where no value was accumulated
+        """
+        if stat == "count":
+            return self.count.astype("float32")
+        results = {
+            "sum": lambda: self.mean * self.count,
+            "mean": lambda: self.mean,
+            "min": lambda: self.min,
+            "max": lambda: self.max,
+            "std": lambda: np.sqrt(self.m2 / np.maximum(self.count - 1, 1)),
+        }
+        if stat not in results:
+            raise ValueError(f"{stat} statistic is not available. {STATS}")
+        return np.where(self.count > 0, results[stat](), self.nodata).astype("float32")
+
+
+def aggregate(
+    items: Iterable[Tuple[datetime, np.ndarray]], freq: str, stat: str, nodata: float
+) -> Iterator[Tuple[str, str, np.ndarray]]:
+    """aggregate consecutive days into periods, a period is yielded as soon as
+    its last day is read
+
+    Args:
+        items (Iterable[Tuple[datetime, np.ndarray]]): consecutive dates and grids
+        freq (str): frequency of the periods, see period
+        stat (str): statistic of the days in a period, see Accumulator.result
+        nodata (float): no data value of the grids
+
+    Yields:
+        Iterator[Tuple[str, str, np.ndarray]]: label, climatology slot and grid of each period
+    """
+    if stat not in STATS:
+        raise ValueError(f"{stat} statistic is not available. {STATS}")
+    key = period(freq)
+    keyed = ((key(date), arr) for date, arr in items)
+    for label, group in groupby(keyed, key=lambda x: x[0]):
+        if label is None:
+            continue
+        acc = None
+        for _, arr in group:
+            if acc is None:
+                acc = Accumulator(arr.shape, nodata)
+            acc.add(arr)
+        yield (*label, acc.result(stat))
+
+
+def climatology(
+    periods: Iterable[Tuple[str, str, np.ndarray]], nodata: float
+) -> Dict[str, np.ndarray]:
+    """mean of the periods in each climatology slot
+
+    Args:
+        periods (Iterable[Tuple[str, str, np.ndarray]]): output of aggregate
+        nodata (float): no data value of the grids
+
+    Returns:
+        Dict[str, np.ndarray]: mean grid of each slot
+    """
+    accs: Dict[str, Accumulator] = {}
+    for _, slot, arr in periods:
+        if slot not in accs:
+            accs[slot] = Accumulator(arr.shape, nodata)
+        accs[slot].add(arr)
+    return {slot: acc.result("mean") for slot, acc in sorted(accs.items())}
+
+
+def anomaly(
+    periods: Iterable[Tuple[str, str, np.ndarray]], clim: Dict[str, np.ndarray], nodata: float
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """difference of the periods from the climatology of their slot
+
+    Args:
+        periods (Iterable[Tuple[str, str, np.ndarray]]): output of aggregate
+        clim (Dict[str, np.ndarray]): output of climatology
+        nodata (float): no data value of the grids
+
+    Yields:
+        Iterator[Tuple[str, np.ndarray]]: label and anomaly grid of each period,
+        no data value where either the period or the climatology has no data
+    """
+    nodata = np.float32(nodata)
+    for label, slot, arr in periods:
+        ref = clim.get(slot)
+        if ref is None:
+            yield (label, np.full(arr.shape, nodata, "float32"))
+            continue
+        valid = (arr != nodata) & (ref != nodata)
+        yield (label, np.where(valid, arr - ref, nodata).astype("float32"))
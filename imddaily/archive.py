@@ -0,0 +1,153 @@
+"""Consolidated local archive of a parameter, an alternative to one .grd file
+per day. The grids are appended to a single binary cube of float32 days in the
+grd layout, and a compact index maps each date to its slot in the cube:
+
+    <prefix>archive.bin  days x (lat * lon) float32, in the order of arrival
+    <prefix>archive.idx  int32 ordinal of the first date, then the slot of each
+                         following date, -1 for dates not in the archive
+
+The cube is read as one memory map, a date is looked up in constant time and
+consecutive days are consecutive rows of the map.
+"""
+import os, threading
+from datetime import date as _date
+from datetime import datetime
+from typing import Iterator, Optional
+import numpy as np
+from .fileio import atomic_write
+
+
+class Archive:
+    """append-only cube of the daily grids of a parameter with a date index.
+    Grids written again for a date, like a revised day, are appended to a new
+    slot and the index is repointed to it, so a grid once written is never
+    changed under a reader of the memory map. The index file is only
+    repointed by save, until then other processes read the earlier grids.
+    Writes are serialized between threads, but there is no lock between
+    processes: only one process may write an archive at a time. Reads may
+    run from any thread or process.
+
+    Args:
+        path (str): directory path of the archive
+        prefix (str): file name prefix of the parameter, like 'rain_'
+        size (int): number of float32 values of a grid
+    """
+
+    def __init__(self, path: str, prefix: str, size: int) -> None:
+        self.data_path = os.path.join(path, f"{prefix}archive.bin")
+        self.index_path = os.path.join(path, f"{prefix}archive.idx")
+        self.size = size
+        self.__lock = threading.Lock()
+        self.__file = None
+        self.__map: Optional[np.memmap] = None
+        try:
+            raw = np.fromfile(self.index_path, "int32")
+        except OSError:
+            raw = np.zeros(0, "int32")
+        self.__first = int(raw[0]) if len(raw) else None
+        self.__slots = raw[1:].copy()
+        self.__count = int(self.__slots.max()) + 1 if len(self.__slots) else 0
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __offset(self, date: datetime) -> int:
+        return date.toordinal() - self.__first if self.__first is not None else -1
+
+    def slot(self, date: datetime) -> int:
+        """row of the date in the cube
+
+        Args:
+            date (datetime): date of the data
+
+        Returns:
+            int: slot of the date, -1 if the date is not in the archive
+        """
+        i = self.__offset(date)
+        return int(self.__slots[i]) if 0 <= i < len(self.__slots) else -1
+
+    def has(self, date: datetime) -> bool:
+        """check if the date is in the archive"""
+        return self.slot(date) >= 0
+
+    def dates(self) -> Iterator[datetime]:
+        """dates in the archive in chronological order"""
+        for i in np.flatnonzero(self.__slots >= 0):
+            yield datetime.combine(_date.fromordinal(self.__first + int(i)), datetime.min.time())
+
+    def write(self, date: datetime, data: bytes) -> None:
+        """append the grid of the date to a new slot of the cube, a date already
+        in the archive is repointed to the new slot in memory
+
+        Args:
+            date (datetime): date of the data
+            data (bytes): grid in the grd layout
+        """
+        if len(data) != self.size * 4:
+            raise ValueError(f"grid of {len(data)} bytes, expected {self.size * 4}")
+        with self.__lock:
+            slot = self.__count
+            if self.__file is None:
+                mode = "r+b" if os.path.exists(self.data_path) else "w+b"
+                self.__file = open(self.data_path, mode)
+            self.__file.seek(slot * self.size * 4)
+            self.__file.write(data)
+            self.__file.flush()
+            # the index is updated after the grid is written so that readers
+            # never see a slot without its data
+            self.__index(date, slot)
+            self.__count = slot + 1
+
+    def __index(self, date: datetime, slot: int) -> None:
+        ordinal = date.toordinal()
+        if self.__first is None:
+            self.__first = ordinal
+        if ordinal < self.__first:
+            pad = np.full(self.__first - ordinal, -1, "int32")
+            self.__slots = np.concatenate([pad, self.__slots])
+            self.__first = ordinal
+        i = ordinal - self.__first
+        if i >= len(self.__slots):
+            grow = np.full(max(i + 1 - len(self.__slots), 366), -1, "int32")
+            self.__slots = np.concatenate([self.__slots, grow])
+        self.__slots[i] = slot
+
+    def read(self, date: datetime) -> Optional[np.ndarray]:
+        """grid of the date as a row of the memory mapped cube
+
+        Args:
+            date (datetime): date of the data
+
+        Returns:
+            Optional[np.ndarray]: flat float32 grid in the grd layout, None if not in the archive
+        """
+        slot = self.slot(date)
+        if slot < 0:
+            return None
+        cube = self.__map
+        if cube is None or slot >= len(cube):
+            with self.__lock:
+                self.__map = cube = np.memmap(
+                    self.data_path, "float32", mode="r", shape=(self.__count, self.size)
+                )
+        return cube[slot]
+
+    def save(self) -> None:
+        """write the index atomically, repointing the dates to the slots
+        written since it was opened, the grids are already on disk"""
+        with self.__lock:
+            if self.__first is None:
+                return
+            used = np.flatnonzero(self.__slots >= 0)
+            slots = self.__slots[: used[-1] + 1] if len(used) else self.__slots[:0]
+            raw = np.concatenate([np.array([self.__first], "int32"), slots])
+            with atomic_write(self.index_path) as f:
+                f.write(raw.tobytes())
+
+    def close(self) -> None:
+        """save the index and close the cube file"""
+        self.save()
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
@@ -0,0 +1,212 @@
+"""Download directory shared as a cache by several processes, like scheduled
+jobs, backfills and notebooks running on one host. Each grd file is downloaded
+under an exclusive lock on its lock file, a process wanting a file which is
+being downloaded waits for the lock and reuses the file instead of fetching it
+again. Files are evicted by age and by the total size of the cache.
+
+    <path>/.locks/<grd file name>.lock  lock file of each grd file, its
+                                        modification time is the last use
+
+Readers hold a shared lock while they open a file, eviction removes a file only
+under the exclusive lock and leaves the files used within the grace period, so
+a job reading the days it fetched a moment ago does not find them removed by
+the eviction of another job. The cache may exceed max_bytes meanwhile.
+
+Locks are advisory locks of the operating system (flock, or msvcrt on
+Windows) and are released when a process exits, even if it crashed. msvcrt has
+no shared locks, on Windows readers take the exclusive lock.
+"""
+import os, time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _acquire(fd: int, blocking: bool, shared: bool = False) -> bool:
+    if fcntl is not None:
+        try:
+            mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            fcntl.flock(fd, mode | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.05)
+
+
+def _release(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _same_file(fd: int, path: str) -> bool:
+    try:
+        return os.path.samestat(os.fstat(fd), os.stat(path))
+    except OSError:
+        return False
+
+
+class Cache:
+    """grd files of a directory shared by processes with per file locks and
+    eviction of the oldest files
+
+    Args:
+        path (str): directory path of the grd files
+        max_bytes (Optional[int]): total size of the grd files kept by evict, defaults to None.
+        max_age (Optional[float]): seconds after which a grd file is downloaded again and
+            evicted, defaults to None.
+        grace (float, optional): seconds after its last use during which a grd file is not
+            evicted. Defaults to 3600.
+    """
+
+    # temporary files of downloads interrupted by a crash are removed after a day
+    __PART_AGE = 86400.0
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+        grace: float = 3600.0,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.grace = grace
+        self.lock_dir = os.path.join(path, ".locks")
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+    def __lock_path(self, filename: str) -> str:
+        return os.path.join(self.lock_dir, f"{filename}.lock")
+
+    @contextmanager
+    def lock(self, filename: str, blocking: bool = True, shared: bool = False) -> Iterator[bool]:
+        """hold the lock of a grd file, other processes and threads locking
+        the same file wait until the block exits. Shared locks of readers
+        only exclude the exclusive locks of downloads and eviction.
+
+        Args:
+            filename (str): name of the grd file
+            blocking (bool, optional): wait for the lock, else give up if it is held.
+                Defaults to True.
+            shared (bool, optional): take a shared lock to read the file. Defaults to False.
+
+        Yields:
+            Iterator[bool]: True if the lock is held, False if not blocking and held elsewhere
+        """
+        path = self.__lock_path(filename)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                acquired = _acquire(fd, blocking, shared)
+            except BaseException:
+                os.close(fd)
+                raise
+            # evict removes the lock file of an evicted grd file while holding
+            # it, a lock taken on the removed file is taken on the new one
+            if not acquired or _same_file(fd, path):
+                break
+            _release(fd)
+            os.close(fd)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                _release(fd)
+            os.close(fd)
+
+    def use(self, filename: str) -> None:
+        """mark the grd file as used now, called under its lock
+
+        Args:
+            filename (str): name of the grd file
+        """
+        os.utime(self.__lock_path(filename))
+
+    def __last_use(self, filename: str) -> float:
+        try:
+            return os.stat(self.__lock_path(filename)).st_mtime
+        except OSError:
+            return 0.0
+
+    def fresh(self, file_path: str, size: int) -> bool:
+        """check if the grd file is complete and not older than max_age
+
+        Args:
+            file_path (str): path of the grd file
+            size (int): size of the full grid in bytes
+
+        Returns:
+            bool: True if the file can be reused
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if stat.st_size != size:
+            return False
+        return self.max_age is None or time.time() - stat.st_mtime <= self.max_age
+
+    def evict(self, keep: Iterable[str] = ()) -> List[str]:
+        """remove the grd files older than max_age, then the least recently
+        used files until the cache fits in max_bytes, with their lock files. Files being downloaded or read, files
+        used within the grace period and files in keep, like the files of the
+        range in use, are not removed.
+
+        Args:
+            keep (Iterable[str]): paths of grd files to keep
+
+        Returns:
+            List[str]: paths of the removed files
+        """
+        keep = {os.path.abspath(p) for p in keep}
+        now = time.time()
+        files = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith(".grd"):
+                    files.append((stat.st_mtime, stat.st_size, entry.name))
+                elif entry.name.endswith(".part") and now - stat.st_mtime > Cache.__PART_AGE:
+                    os.remove(entry.path)
+        total = sum(size for _, size, _ in files)
+        # least recently used first, a file is used when it is downloaded or read
+        files.sort(key=lambda f: max(f[0], self.__last_use(f[2])))
+        removed = []
+        for mtime, size, name in files:
+            file_path = os.path.join(self.path, name)
+            expired = self.max_age is not None and now - mtime > self.max_age
+            over = self.max_bytes is not None and total > self.max_bytes
+            if not (expired or over) or os.path.abspath(file_path) in keep:
+                continue
+            used = self.__last_use(name)
+            if now - used < self.grace:
+                continue
+            with self.lock(name, blocking=False) as acquired:
+                # a use between the check and the lock also keeps the file
+                if not acquired or (used and self.__last_use(name) != used):
+                    continue
+                for path in (file_path, self.__lock_path(name)):
+                    try:
+                        os.remove(path)
+                    except OSError:  # already removed, or open elsewhere on Windows
+                        pass
+            total -= size
+            removed.append(file_path)
+        return removed
@@ -0,0 +1,107 @@
+"""Catalog of the days available on the IMD server for a parameter, persisted
+as JSON next to the downloaded grd files. Days are recorded from the outcome of
+the downloads and from HEAD probes, so a range can be planned against the known
+days and the days known to be unpublished are not requested again until the
+entry expires.
+"""
+import json, threading, time
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+from .fileio import atomic_write
+
+if TYPE_CHECKING:
+    from .core import IMD
+
+
+class Catalog:
+    """availability of the days of a parameter. Available days are kept,
+    unavailable days are probed again once their entry is older than ttl as
+    late days may still be published.
+
+    Args:
+        imd (IMD): parameter of the catalog
+        path (str): directory path of the catalog file, usually the grd directory
+        ttl (float, optional): seconds after which an unavailable day is checked again.
+            Defaults to 86400.
+    """
+
+    def __init__(self, imd: "IMD", path: str, ttl: float = 86400.0) -> None:
+        self.__imd = imd
+        _, self.path = imd._get_labelpath("catalog", path, "json")
+        self.ttl = ttl
+        self.__lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.days: Dict[str, Tuple[bool, float]] = {
+                    d: (bool(a), float(t)) for d, (a, t) in json.load(f).items()
+                }
+        except (OSError, ValueError, TypeError):
+            self.days = {}
+
+    def status(self, date: datetime) -> Optional[bool]:
+        """known availability of the date
+
+        Args:
+            date (datetime): date of the data
+
+        Returns:
+            Optional[bool]: True if available, False if unavailable and checked
+            within ttl, None if unknown or expired
+        """
+        entry = self.days.get(f"{date:%Y-%m-%d}")
+        if entry is None:
+            return None
+        available, checked = entry
+        if not available and time.time() - checked > self.ttl:
+            return None
+        return available
+
+    def record(self, date: datetime, available: bool) -> None:
+        """record the availability of the date
+
+        Args:
+            date (datetime): date of the data
+            available (bool): whether the grd file is published
+        """
+        with self.__lock:
+            self.days[f"{date:%Y-%m-%d}"] = (available, time.time())
+
+    def refresh(self, dates: Iterable[datetime], workers: int = 10) -> None:
+        """probe the dates which are unknown or expired with HEAD requests,
+        dates which cannot be probed stay unknown
+
+        Args:
+            dates (Iterable[datetime]): dates to be checked
+            workers (int, optional): number of concurrent probes. Defaults to 10.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        stale = [d for d in dates if self.status(d) is None]
+        if not stale:
+            return
+        ex = self.__imd._executor or ThreadPoolExecutor(workers)
+        try:
+            for date, available in zip(stale, ex.map(self.__imd._probe, stale)):
+                if available is not None:
+                    self.record(date, available)
+        finally:
+            if ex is not self.__imd._executor:
+                ex.shutdown()
+
+    def available(self, dates: Iterable[datetime]) -> List[datetime]:
+        """dates known to be available
+
+        Args:
+            dates (Iterable[datetime]): dates to be looked up
+
+        Returns:
+            List[datetime]: available dates
+        """
+        return [d for d in dates if self.status(d)]
+
+    def save(self) -> None:
+        """write the catalog atomically to its file"""
+        with self.__lock:
+            days = dict(sorted(self.days.items()))
+        with atomic_write(self.path, "w") as f:
+            json.dump(days, f, indent=0)
@@ -0,0 +1,159 @@
+"""Command line tool of the imddaily package which keeps a local copy of the
+IMD real time data in sync, fetching only the days which are missing locally.
+
+    imddaily sync --params rain,tmax --since 2015-06-01 --out /data/grd --tif /data/tif
+    imddaily sync --params rain --since 2020-01-01 --out /data/grd --watch --interval 3600
+
+The exit status is 1 when days failed after all retries, so scheduled jobs can
+detect a broken sync.
+"""
+import argparse, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timedelta as td
+from itertools import groupby
+from typing import Dict, List, Optional, Sequence, Tuple
+from .cache import Cache
+from .core import IMD, _new_session
+from .imddaily import _IMDPARAMS, __version__, get_data
+
+
+def _runs(dates: List[datetime]) -> List[Tuple[datetime, datetime]]:
+    """group the dates into runs of consecutive days
+
+    Args:
+        dates (List[datetime]): sorted dates
+
+    Returns:
+        List[Tuple[datetime, datetime]]: first and last date of each run
+    """
+    runs = []
+    for _, group in groupby(enumerate(dates), key=lambda x: x[1] - td(days=x[0])):
+        group = [date for _, date in group]
+        runs.append((group[0], group[-1]))
+    return runs
+
+
+def sync(
+    params: Sequence[str],
+    since: datetime,
+    until: datetime,
+    out: str,
+    tif: Optional[str] = None,
+    quiet: bool = True,
+    **kwargs,
+) -> Dict[str, Tuple[int, List[str], List[str]]]:
+    """download the days from since to until which are missing in out for each
+    parameter, converting them to GeoTIFF in tif as they arrive
+
+    Args:
+        params (Sequence[str]): parameters to sync
+        since (datetime): first date, later dates are used for parameters published later
+        until (datetime): last date
+        out (str): directory path of the grd files
+        tif (Optional[str]): directory path of the GeoTIFF files, defaults to None.
+        quiet (bool, optional): when True does not display Progress Bar. Defaults to True.
+        **kwargs: other arguments of get_data like pool_size, session, executor, archive
+            or catalog
+
+    Returns:
+        Dict[str, Tuple[int, List[str], List[str]]]: number of days downloaded,
+        dates unavailable and dates failed after all retries for each parameter
+    """
+    for folder in (out, tif):
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+    result = {}
+    for param in params:
+        imd = IMD(param, kwargs.get("session"))
+        if kwargs.get("archive"):
+            imd._open_archive(out)
+        if kwargs.get("cache"):
+            imd._cache = Cache(out, max_age=kwargs.get("cache_max_age"))
+        missing = imd._missing_dates(max(since, imd._first_date), until, out)
+        fetched, skipped, failed = 0, [], []
+        for start, end in _runs(missing):
+            try:
+                data = get_data(
+                    param, f"{start:%Y-%m-%d}", f"{end:%Y-%m-%d}", out, quiet,
+                    geotiff_path=tif, **kwargs,
+                )
+            except IOError:
+                skipped.extend(f"{d:%Y-%m-%d}" for d in imd._dtrgen(start, end))
+                continue
+            fetched += len(data)
+            failed.extend(data.failed_downloads)
+            skipped.extend(d for d in data.skipped_downloads if d not in data.failed_downloads)
+        result[param] = (fetched, sorted(skipped), sorted(failed))
+    return result
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="imddaily", description="Download and Convert IMD Daily Data"
+    )
+    parser.add_argument("--version", action="version", version=__version__)
+    sub = parser.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("sync", help="download the days missing locally")
+    s.add_argument("--params", required=True, help=f"comma separated, any of {','.join(_IMDPARAMS)}")
+    s.add_argument("--since", required=True, help="start date YYYY-MM-DD")
+    s.add_argument("--until", help="end date YYYY-MM-DD, defaults to today")
+    s.add_argument("--out", required=True, help="directory path of the .grd files")
+    s.add_argument("--archive", action="store_true", help="store the days in one archive per parameter in out")
+    s.add_argument("--cache", action="store_true", help="share out with other processes as a locked download cache")
+    s.add_argument("--cache-max-gb", type=float, help="size of the .grd files kept in the cache")
+    s.add_argument("--cache-max-days", type=float, help="age in days after which cached .grd files are refreshed")
+    s.add_argument(
+        "--catalog", action="store_true",
+        help="keep a catalog of the published days and do not request unpublished days again for a day",
+    )
+    s.add_argument("--tif", help="directory path to convert the new days to GeoTIFF")
+    s.add_argument("--compress", help="compression of the GeoTIFF files like deflate, lzw or zstd")
+    s.add_argument("--cog", action="store_true", help="write the GeoTIFF files as Cloud Optimized GeoTIFF")
+    s.add_argument("--workers", type=int, default=10, help="download threads and connections shared by the parameters")
+    s.add_argument("--sink-workers", type=int, default=2, help="GeoTIFF conversion threads")
+    s.add_argument("--retries", type=int, default=3, help="retries for connection errors and 5xx responses")
+    s.add_argument("--base-url", help="mirror of the IMD server")
+    s.add_argument(
+        "--watch", action="store_true",
+        help="keep running and poll for newly published days, implies --catalog",
+    )
+    s.add_argument("--interval", type=float, default=3600, help="seconds between polls in watch mode")
+    s.add_argument("--quiet", action="store_true", help="do not display progress bars")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parser().parse_args(argv)
+    params = [p.strip() for p in args.params.split(",") if p.strip()]
+    unknown = [p for p in params if p not in _IMDPARAMS]
+    if unknown:
+        print(f"{unknown} is not available in IMD. {_IMDPARAMS}", file=sys.stderr)
+        return 2
+    since = datetime.strptime(args.since, "%Y-%m-%d")
+    session = _new_session(args.workers, args.retries)
+    with ThreadPoolExecutor(args.workers) as executor:
+        while True:
+            today = datetime.combine(datetime.now().date(), datetime.min.time())
+            until = datetime.strptime(args.until, "%Y-%m-%d") if args.until else today
+            result = sync(
+                params, since, until, args.out, args.tif, args.quiet,
+                pool_size=args.workers, session=session, executor=executor,
+                sink_workers=args.sink_workers, base_url=args.base_url, archive=args.archive,
+                catalog=args.catalog or args.watch,
+                cache=args.cache, geotiff_options={"compress": args.compress, "cog": args.cog},
+                cache_max_bytes=int(args.cache_max_gb * 2**30) if args.cache_max_gb else None,
+                cache_max_age=args.cache_max_days * 86400 if args.cache_max_days else None,
+            )
+            for param, (fetched, skipped, failed) in result.items():
+                print(
+                    f"{param}: {fetched} day(s) downloaded, {len(skipped)} unavailable, "
+                    f"{len(failed)} failed"
+                )
+            if not args.watch:
+                return 1 if any(failed for _, _, failed in result.values()) else 0
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,15 +6,70 @@ Raises:
     ValueError: Start Date is mandatory
     ValueError: Provided date format cannot be recognized
 """
-import requests, os
+import os, json, threading
 from datetime import datetime
 from datetime import timedelta as td
-from typing import Optional, Iterator, Tuple
+from email.utils import formatdate
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Iterator, Set, Tuple
+from contextlib import contextmanager, nullcontext
 import numpy as np
-import rasterio
-from rasterio.crs import CRS
 from affine import Affine
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections import deque
+from functools import partial
+from itertools import islice
+from time import perf_counter
+from .archive import Archive
+from .cache import Cache
+from .fileio import atomic_write
+from .metrics import NOOP, Event, Metrics
+
+# requests, rasterio and the executors are imported where they are used so
+# that importing imddaily and inspecting the grids stays fast
+if TYPE_CHECKING:
+    import requests
+    from concurrent.futures import Executor
+
+
+class _Truncated(Exception):
+    """the response ended before the full grid was received"""
+
+
+def _new_session(
+    pool_size: int = 10, retries: int = 3, backoff: float = 0.5
+) -> "requests.Session":
+    """create a requests session with a pool of keep-alive connections which
+    retries connection errors and 5xx responses with exponential backoff.
+    A 404 is not retried as it means the data is not published.
+
+    Args:
+        pool_size (int, optional): maximum connections kept alive per host. Defaults to 10.
+        retries (int, optional): number of retries for a failed request. Defaults to 3.
+        backoff (float, optional): backoff factor in seconds between retries. Defaults to 0.5.
+
+    Returns:
+        requests.Session: session to be shared by the download threads
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 class IMD:
@@ -23,6 +78,10 @@ class IMD:
 
     Args:
         param (str): one of 'raingpm','tmax','tmin','rain','tmaxone','tminone'
+        session (Optional[requests.Session]): session used for downloads, defaults to None.
+        timeout (Tuple[float, float], optional): connect and read timeout in seconds. Defaults to (10, 60).
+        base_url (Optional[str]): url of the IMD real time data or its mirror, defaults to None.
+        executor (Optional[Executor]): thread pool shared with other parameters, defaults to None.
 
     Raises:
         OSError: directory path does not exist
@@ -30,13 +89,14 @@ class IMD:
         ValueError: Provided date format cannot be recognized
     """
 
+    __IMDHOST = "https://www.imdpune.gov.in/cmpg/Realtimedata/"
     __IMDURL = {
-        "raingpm": "https://www.imdpune.gov.in/cmpg/Realtimedata/gpm/",
-        "tmax": "https://www.imdpune.gov.in/cmpg/Realtimedata/max/",
-        "tmin": "https://www.imdpune.gov.in/cmpg/Realtimedata/min/",
-        "rain": "https://www.imdpune.gov.in/cmpg/Realtimedata/Rainfall/",
-        "tmaxone": "https://www.imdpune.gov.in/cmpg/Realtimedata/maxone/",
-        "tminone": "https://www.imdpune.gov.in/cmpg/Realtimedata/minone/",
+        "raingpm": "gpm/",
+        "tmax": "max/",
+        "tmin": "min/",
+        "rain": "Rainfall/",
+        "tmaxone": "maxone/",
+        "tminone": "minone/",
     }  # https://www.imdpune.gov.in/lrfindex.php
     __IMDFMT = {
         "raingpm": ("", "%d%m%Y", "raingpm_"),
@@ -62,10 +122,45 @@ class IMD:
         "tmaxone": (7.5, 37.5, 67.5, 97.5),
         "tminone": (7.5, 37.5, 67.5, 97.5),
     }
+    __FIRSTDATE = {
+        "raingpm": datetime(2015, 10, 1),
+        "tmax": datetime(2015, 6, 1),
+        "tmin": datetime(2015, 6, 1),
+        "rain": datetime(2018, 12, 9),
+        "tmaxone": datetime(2019, 1, 1),
+        "tminone": datetime(2019, 1, 1),
+    }
+    # classic TIFF offsets are 32 bit, keep a margin for headers and overviews
+    __BIGTIFF_SIZE = 2**32 - 2**26
+    # days read ahead of the single GeoTIFF writer, whatever the number of workers
+    __IN_FLIGHT_DAYS = 16
+    __COG_PREDICTOR = {1: "NO", 2: "STANDARD", 3: "FLOATING_POINT"}
+    __VRT_TYPES = {
+        "uint8": "Byte", "int8": "Int8", "uint16": "UInt16", "int16": "Int16",
+        "uint32": "UInt32", "int32": "Int32", "float32": "Float32", "float64": "Float64",
+    }
 
-    def __init__(self, param: str) -> None:
+    def __init__(
+        self,
+        param: str,
+        session: Optional["requests.Session"] = None,
+        timeout: Tuple[float, float] = (10, 60),
+        base_url: Optional[str] = None,
+        executor: Optional["Executor"] = None,
+    ) -> None:
         self.param = param
-        self.__imdurl = IMD.__IMDURL[self.param]
+        host = base_url.rstrip("/") + "/" if base_url else IMD.__IMDHOST
+        self.__imdurl = f"{host}{IMD.__IMDURL[self.param]}"
+        self._session = session
+        self.__session_lock = threading.Lock()
+        self._timeout = timeout
+        self._executor = executor
+        self._metrics: Metrics = NOOP
+        self._manifest: Optional[Dict[str, Dict[str, str]]] = None
+        self._archive: Optional[Archive] = None
+        self._cache: Optional[Cache] = None
+        self._cached_days: Set[datetime] = set()  # days fetched into the shared cache
+        self.__manifest_lock = threading.Lock()
         self.__pfx, self.__dtfmt, self.__opfx = IMD.__IMDFMT[self.param]
         (
             self._lat_size,
@@ -76,8 +171,12 @@ class IMD:
             self.__name,
         ) = IMD.__ATTRS[self.param]
         self._lat1, self._lat2, self._lon1, self._lon2 = IMD.__EXTENT[self.param]
+        self._first_date = IMD.__FIRSTDATE[self.param]
+        self._grd_size = self._lat_size * self._lon_size * 4
         self._lat_array = np.linspace(self._lat1, self._lat2, self._lat_size)
         self._lon_array = np.linspace(self._lon1, self._lon2, self._lon_size)
+        # rows (south to north as stored in the grd) and columns which are read
+        self._window = (slice(0, self._lat_size), slice(0, self._lon_size))
         self.__transform = Affine(
             self._px_size,
             0.0,
@@ -88,48 +187,342 @@ class IMD:
         )
         self._profile = {
             "driver": "GTiff",
-            "dtype": "float64",
+            "dtype": "float32",
             "nodata": self.__undef,
             "width": self._lon_size,
             "height": self._lat_size,
             "count": 1,
-            "crs": CRS.from_epsg(4326),
+            "crs": "EPSG:4326",
             "transform": self.__transform,
             "tiled": False,
             "interleave": "band",
         }
 
-    def fetch_grd(self, url: str) -> Tuple[bool, requests.Response]:
-        """download of grd data from the url provided
+    def _meta(self) -> Dict[str, Any]:
+        """units, long name and no data value of the parameter
+
+        Returns:
+            Dict[str, Any]: metadata with keys units, long_name and nodata
+        """
+        return {"units": self.__units, "long_name": self.__name, "nodata": self.__undef}
+
+    def _connect(self, pool_size: int = 10, retries: int = 3, backoff: float = 0.5) -> "requests.Session":
+        """session used for the downloads, created on first use
+
+        Args:
+            pool_size (int, optional): maximum connections kept alive per host. Defaults to 10.
+            retries (int, optional): number of retries for a failed request. Defaults to 3.
+            backoff (float, optional): backoff factor in seconds between retries. Defaults to 0.5.
+
+        Returns:
+            requests.Session: session of the parameter
+        """
+        with self.__session_lock:
+            if self._session is None:
+                self._session = _new_session(pool_size, retries, backoff)
+            return self._session
+
+    def fetch_grd(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[bool, Optional["requests.Response"]]:
+        """download of grd data from the url provided through the pooled session,
+        retrying connection errors and 5xx responses. The body of the response
+        is not read until accessed.
 
         Args:
             url (str): url to download the grd data
+            headers (Optional[Dict[str, str]]): extra request headers, defaults to None.
+
+        Returns:
+            Tuple[bool, Optional[requests.Response]]: status and response of the
+            requests call, response is None if the server could not be reached
+        """
+        r, _ = self.__request(url, headers)
+        return (r is not None and r.status_code == 200, r)
+
+    def __request(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[Optional["requests.Response"], Optional[str]]:
+        """streamed GET of the url, returning the response or the name of the
+        error if the server could not be reached"""
+        import requests
+
+        session = self._session or self._connect()
+        try:
+            r = session.get(
+                url,
+                headers=headers,
+                allow_redirects=True,
+                timeout=self._timeout,
+                stream=True,
+            )
+        except requests.RequestException as e:
+            return (None, type(e).__name__)
+        return (r, None)
+
+    def _grd_url(self, date: datetime) -> str:
+        """url of the grd file of the date on the server
+
+        Args:
+            date (datetime): date of the data
+
+        Returns:
+            str: url of the grd file
+        """
+        return f"{self.__imdurl}{self.__pfx}{date.strftime(self.__dtfmt)}.grd"
+
+    def _probe(self, date: datetime) -> Optional[bool]:
+        """check with a HEAD request whether the grd file of the date is
+        published, without transferring it
+
+        Args:
+            date (datetime): date of the data
 
         Returns:
-            Tuple[bool, requests.Response]: status and response of the requests call
+            Optional[bool]: True if published, False if not found (404), None if
+            the server could not be reached or answered with another error
         """
-        r = requests.get(url, allow_redirects=True)
-        return (r.status_code == 200, r)
+        import requests
+
+        session = self._session or self._connect()
+        try:
+            with session.head(self._grd_url(date), allow_redirects=True, timeout=self._timeout) as r:
+                status = r.status_code
+        except requests.RequestException:
+            return None
+        return {200: True, 404: False}.get(status)
 
-    def _download_grd(self, date: datetime, path: str) -> Optional[str]:
-        """download of grd data for given date and stored in given file path
+    def _download_grd(
+        self, date: datetime, path: str
+    ) -> Optional[Tuple[str, Optional[int]]]:
+        """download of grd data for given date and stored in given file path.
+        When the manifest is loaded (resume mode) a complete existing file is
+        only downloaded again if the server reports it as changed. With an
+        archive open the grid is written into the archive instead of a file,
+        days already in the archive are only requested in resume mode.
+        With a shared cache the file is downloaded under its lock, a fresh
+        file left by another process holding the lock is reused, and the file
+        is marked as used so that other processes do not evict it right away.
 
         Args:
             date (datetime): date for download of data
             path (str): file path where downloaded data will be stored in .grd
 
         Returns:
-            Optional[str]: date if download failed or None if succeed
-        """
-        url = f"{self.__imdurl}{self.__pfx}{date.strftime(self.__dtfmt)}.grd"
-        _, out_file = self._get_filepath(date, path, "grd")
-        status, r = self.fetch_grd(url)
-        if not status:
-            return date.strftime("%Y-%m-%d")
-        with open(out_file, "wb") as f:
-            f.write(r.content)
+            Optional[Tuple[str, Optional[int]]]: date and http status code (None
+            if the server could not be reached) if download failed or None if succeed
+        """
+        filename, out_file = self._get_filepath(date, path, "grd")
+        if self._archive is not None and self._manifest is None and self._archive.has(date):
+            # appending the day again would grow the archive on every run,
+            # resume checks it for a revision with a conditional request
+            with self._metrics.timer("fetch", date) as t:
+                t.cached = True
+            return None
+        if self._cache is None:
+            return self.__download(date, path, filename, out_file)
+        with self._cache.lock(filename):
+            if self._cache.fresh(out_file, self._grd_size):
+                # reported like a download so that sinks and progress count every day
+                with self._metrics.timer("fetch", date) as t:
+                    t.cached = True
+                result = None
+            else:
+                result = self.__download(date, path, filename, out_file)
+            if result is None:
+                self._cache.use(filename)
+                self._cached_days.add(date)
+            return result
+
+    def __download(
+        self, date: datetime, path: str, filename: str, out_file: str
+    ) -> Optional[Tuple[str, Optional[int]]]:
+        url = self._grd_url(date)
+        headers = None
+        if self._manifest is not None and self._has_day(date, path):
+            headers = self.__conditional_headers(filename, out_file)
+        with self._metrics.timer("fetch", date) as t:
+            r, t.error = self.__request(url, headers)
+            if r is None:
+                return (date.strftime("%Y-%m-%d"), None)
+            with r:
+                t.status = r.status_code
+                retries = getattr(r.raw, "retries", None)
+                t.retries = len(retries.history) if retries else 0
+                if headers and r.status_code == 304:
+                    return None
+                if r.status_code != 200:
+                    t.error = f"HTTP {r.status_code}"
+                    return (date.strftime("%Y-%m-%d"), r.status_code)
+                size, error = self.__write_grd(r, date, path, filename, out_file, t)
+                t.nbytes, t.error = size, error
+                if error:
+                    return (date.strftime("%Y-%m-%d"), None)
+        if self._manifest is not None:
+            with self.__manifest_lock:
+                self._manifest[filename] = {
+                    k: r.headers[k] for k in ("ETag", "Last-Modified") if k in r.headers
+                }
         return None
 
+    def __write_grd(
+        self, r: "requests.Response", date: datetime, path: str, filename: str, out_file: str, fetch: Any
+    ) -> Tuple[int, Optional[str]]:
+        """stream the response in chunks to a temporary file in the directory and
+        rename it to the output file only if it holds the full grid, so that
+        readers never see a partial file. With an archive open the chunks are
+        collected in memory and the full grid is written into the archive.
+        The time spent writing is reported as the write stage and left out of
+        the fetch stage.
+
+        Args:
+            r (requests.Response): streamed response of the grd file
+            date (datetime): date of the grd file
+            path (str): directory path of the grd files
+            filename (str): name of the grd file
+            out_file (str): path of the grd file
+            fetch (Any): timer of the fetch stage
+
+        Returns:
+            Tuple[int, Optional[str]]: bytes received and the reason if the
+            complete file was not written
+        """
+        import requests
+
+        size, spent = 0, 0.0
+        try:
+            if self._archive is not None:
+                body = bytearray()
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    body += chunk
+                if size != self._grd_size:
+                    return (size, "truncated")
+                t = perf_counter()
+                self._archive.write(date, body)
+                spent += perf_counter() - t
+                return (size, None)
+            with atomic_write(out_file) as f:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    t = perf_counter()
+                    f.write(chunk)
+                    spent += perf_counter() - t
+                if size != self._grd_size:
+                    raise _Truncated
+                t = perf_counter()
+            spent += perf_counter() - t
+            return (size, None)
+        except _Truncated:
+            return (size, "truncated")
+        except requests.RequestException as e:
+            return (size, type(e).__name__)
+        finally:
+            if self._metrics.enabled:
+                fetch.exclude(spent)
+                self._metrics.emit(Event("write", date, spent, size))
+
+    def _is_complete(self, file_path: str) -> bool:
+        """check if the grd file exists with the full size of the grid
+
+        Args:
+            file_path (str): path of the grd file
+
+        Returns:
+            bool: True if the file is complete
+        """
+        try:
+            return os.path.getsize(file_path) == self._grd_size
+        except OSError:
+            return False
+
+    def _has_day(self, date: datetime, grd_dir: str) -> bool:
+        """check if the full grid of the date is stored locally, in the archive
+        if one is open or else as a complete grd file, which has to be fresh
+        with a shared cache
+
+        Args:
+            date (datetime): date of the data
+            grd_dir (str): path to grd files
+
+        Returns:
+            bool: True if the grid of the date is stored
+        """
+        if self._archive is not None:
+            return self._archive.has(date)
+        if self._cache is not None:
+            return self._cache.fresh(self._get_filepath(date, grd_dir, "grd")[1], self._grd_size)
+        return self._is_complete(self._get_filepath(date, grd_dir, "grd")[1])
+
+    def _open_archive(self, path: str) -> Archive:
+        """open the archive of the parameter in the directory, the downloads and
+        reads then go through the archive instead of the grd files
+
+        Args:
+            path (str): directory path of the archive
+
+        Returns:
+            Archive: archive of the parameter
+        """
+        self._archive = Archive(path, self.__opfx, self._lat_size * self._lon_size)
+        return self._archive
+
+    def __conditional_headers(self, filename: str, file_path: str) -> Dict[str, str]:
+        """headers for a conditional GET of an existing grd file from the
+        validators in the manifest, or the file modification time if the day
+        is stored as a grd file
+
+        Args:
+            filename (str): name of the grd file
+            file_path (str): path of the grd file
+
+        Returns:
+            Dict[str, str]: If-None-Match and/or If-Modified-Since headers
+        """
+        entry = self._manifest.get(filename, {})
+        headers = {}
+        if "ETag" in entry:
+            headers["If-None-Match"] = entry["ETag"]
+        if "Last-Modified" in entry:
+            headers["If-Modified-Since"] = entry["Last-Modified"]
+        elif os.path.isfile(file_path):
+            headers["If-Modified-Since"] = formatdate(os.path.getmtime(file_path), usegmt=True)
+        return headers
+
+    def _manifest_path(self, path: str) -> str:
+        """path of the manifest which stores the validators of the downloaded
+        grd files of the parameter
+
+        Args:
+            path (str): directory path of the grd files
+
+        Returns:
+            str: file path of the manifest
+        """
+        return os.path.join(path, f"{self.__opfx}manifest.json")
+
+    def _load_manifest(self, path: str) -> None:
+        """load the manifest from the directory, enabling resume mode
+
+        Args:
+            path (str): directory path of the grd files
+        """
+        try:
+            with open(self._manifest_path(path)) as f:
+                self._manifest = json.load(f)
+        except (OSError, ValueError):
+            self._manifest = {}
+
+    def _save_manifest(self, path: str) -> None:
+        """save the manifest to the directory atomically, the directory may be
+        shared with other processes
+
+        Args:
+            path (str): directory path of the grd files
+        """
+        with atomic_write(self._manifest_path(path), "w") as f:
+            json.dump(self._manifest, f, indent=1, sort_keys=True)
+
     def _get_filepath(self, date: datetime, path: str, ext: str, xdate: Optional[datetime] = None) -> Tuple[str, str]:
         """generate file path for provided date and format in the provided
         directory path
@@ -147,6 +540,21 @@ class IMD:
         filename = f"{self.__opfx}{date:%Y%m%d}{extra}.{ext}"
         return (filename, os.path.join(path, filename))
 
+    def _get_labelpath(self, label: str, path: str, ext: str) -> Tuple[str, str]:
+        """generate file path for a label like an aggregation period in the
+        provided directory path
+
+        Args:
+            label (str): label to follow the parameter prefix in the filename
+            path (str): directory path
+            ext (str): file extension
+
+        Returns:
+            Tuple[str, str]: file name and the file path
+        """
+        filename = f"{self.__opfx}{label}.{ext}"
+        return (filename, os.path.join(path, filename))
+
     def _checked_path(self, path: str, type: int = 0, err_raise: bool = True) -> str:
         """Check the existance of directory or file path based on mentioned type
 
@@ -183,15 +591,6 @@ class IMD:
         Returns:
             Tuple[datetime, datetime]: start date and end date
         """
-        self.__imd_first_date = {
-            "raingpm": datetime.strptime("20151001", "%Y%m%d"),
-            "tmax": datetime.strptime("20150601", "%Y%m%d"),
-            "tmin": datetime.strptime("20150601", "%Y%m%d"),
-            "rain": datetime.strptime("20181209", "%Y%m%d"),
-            "tmaxone": datetime.strptime("20190101", "%Y%m%d"),
-            "tminone": datetime.strptime("20190101", "%Y%m%d"),
-        }
-        self.__first_date = self.__imd_first_date[self.param]
         if not start_date:
             raise ValueError("Start Date is required.")
         end_date = (end_date, start_date)[end_date is None]
@@ -199,74 +598,242 @@ class IMD:
         edate = datetime.strptime(end_date, "%Y-%m-%d")
         if sdate > edate:
             sdate, edate = edate, sdate
-        if self.__first_date > sdate:
+        if self._first_date > sdate:
             raise ValueError(
-                f'Data available after {self.__first_date.strftime("%Y-%m-%d")}'
+                f'Data available after {self._first_date.strftime("%Y-%m-%d")}'
             )
         return (sdate, edate)
 
     def __read_grd(self, file_path: str) -> np.ndarray:
-        """read the input grd file as numpy ndarray
+        """memory map the input grd file as numpy ndarray without copying it
 
         Args:
             file_path (str): path for the grd file
 
         Returns:
-            np.ndarray: grd file read as numpy ndarray
+            np.ndarray: grd file mapped as read only numpy ndarray
         """
-        with open(file_path, "rb") as f:
-            return np.fromfile(f, "float32")
+        return np.memmap(file_path, "float32", mode="r")
 
-    def _transform_array(self, arr: np.ndarray, flip_ax: int, num_bands: Optional[int] = None) -> np.ndarray:
-        """reshape and flip the numpy ndarray
+    def _bbox_window(self, bbox: Tuple[float, float, float, float]) -> Tuple[slice, slice]:
+        """rows and columns of the pixels intersecting the bounding box
 
         Args:
-            arr (np.ndarray): grd data read as numpy ndarray
-            flip_ax (int): axis along which to flip the array
-            num_bands (Optional[int]): number of bands in a single tif file
+            bbox (Tuple[float, float, float, float]): min lon, min lat, max lon, max lat
+
+        Raises:
+            ValueError: bounding box does not intersect the grid
 
         Returns:
-            np.ndarray: transformed array
+            Tuple[slice, slice]: rows (south to north) and columns of the window
         """
-        if num_bands:
-            arr = arr.reshape(num_bands, self._lat_size, self._lon_size)
-        else:
-            arr = arr.reshape(self._lat_size, self._lon_size)
-        return np.flip(arr, flip_ax)
+        west, south, east, north = bbox
+        half = self._px_size / 2
+        rows = np.nonzero((self._lat_array + half > south) & (self._lat_array - half < north))[0]
+        cols = np.nonzero((self._lon_array + half > west) & (self._lon_array - half < east))[0]
+        if not (len(rows) and len(cols)):
+            raise ValueError(f"{bbox} does not intersect the {self.param} grid")
+        return (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
 
-    def _to_numpy(self, path: str, flip_ax: int) -> np.ndarray:
-        """read the grd array as numpy array and transform the array
+    @contextmanager
+    def _subset(self, bbox: Optional[Tuple[float, float, float, float]]):
+        """temporarily read only the window of the bounding box
 
         Args:
-            path (str): path of the grd file
-            flip_ax (int): axis along which to flip the array
+            bbox (Optional[Tuple[float, float, float, float]]): min lon, min lat, max lon,
+                max lat or None to keep the current window
+        """
+        window = self._window
+        if bbox:
+            self._window = self._bbox_window(bbox)
+        try:
+            yield
+        finally:
+            self._window = window
+
+    @property
+    def _shape(self) -> Tuple[int, int]:
+        """rows and columns of the window"""
+        rows, cols = self._window
+        return (rows.stop - rows.start, cols.stop - cols.start)
+
+    def _coords(self) -> Tuple[np.ndarray, np.ndarray]:
+        """latitudes (north to south) and longitudes (west to east) of the
+        pixel centres of the north up arrays of the window
 
         Returns:
-            np.ndarray: correct grd data as numpy ndarray
+            Tuple[np.ndarray, np.ndarray]: latitudes and longitudes
         """
-        return self._transform_array(self.__read_grd(path), flip_ax)
+        rows, cols = self._window
+        return (self._lat_array[rows][::-1].copy(), self._lon_array[cols].copy())
 
     def _get_array(
-        self, date: datetime, grd_dir: str, tif_dir: str
+        self, date: datetime, grd_dir: str, tif_dir: str, dtype: str = "float32"
     ) -> Tuple[datetime, str, np.ndarray]:
-        """read and transform grd file if it exist or return numpy array with
-        no data values
+        """read and transform grd file if it exist with the full grid or return
+        numpy array with no data values
 
         Args:
             date (datetime): date of the data being read
             grd_dir (str): path to grd file
             tif_dir (str): path for the tif file
+            dtype (str, optional): output data type. Defaults to "float32".
 
         Returns:
             Tuple[datetime, str, np.ndarray]: date, tif file path and numpy array
         """
-        _, filepath = self._get_filepath(date, grd_dir, "grd")
-        if self._checked_path(filepath, 1, err_raise=False):
-            data = self._to_numpy(filepath, 0)
-        else:
-            data = np.full((self._lat_size, self._lon_size), self.__undef)
         _, out_file = self._get_filepath(date, tif_dir, "tif")
-        return (date, out_file, data)
+        return (date, out_file, self._load_day(date, grd_dir, dtype))
+
+    def _load_day(self, date: datetime, grd_dir: str, dtype: Optional[str] = "float32") -> np.ndarray:
+        """read the window of the grid of the date as a north up array,
+        reporting the read and transform stages to the metrics sink. Days
+        which are not stored are filled with no data values. This is the
+        single read path of the stored days.
+
+        Args:
+            date (datetime): date of the data being read
+            grd_dir (str): path to grd file
+            dtype (Optional[str]): output data type of an array read into memory, None
+                for a view of the memory mapped grid, integer types are rounded.
+                Defaults to "float32".
+
+        Returns:
+            np.ndarray: (lat, lon) array of the date
+        """
+        with self._metrics.timer("read", date) as t:
+            flat = self._read_flat(date, grd_dir)
+            if flat is not None:
+                arr = flat.reshape(self._lat_size, self._lon_size)[self._window]
+                if dtype is not None:
+                    arr = np.array(arr)
+            else:
+                arr = np.full(self._shape, self.__undef, "float32")
+                t.error = "missing"
+            t.nbytes = arr.nbytes
+        with self._metrics.timer("transform", date):
+            arr = np.flip(arr, 0)
+            if dtype is None:
+                return arr
+            if np.issubdtype(np.dtype(dtype), np.integer):
+                # round instead of truncating towards zero
+                arr = np.rint(arr)
+            return arr.astype(dtype)
+
+    def _read_flat(self, date: datetime, grd_dir: str) -> Optional[np.ndarray]:
+        """memory map the grid of the date in its stored order (south to north
+        rows) as a flat array, from the archive if one is open or else from
+        the grd file. All the reads of the stored grids go through here. With
+        a shared cache the file is mapped under a shared lock.
+
+        Args:
+            date (datetime): date of the data being read
+            grd_dir (str): path to grd file
+
+        Raises:
+            FileNotFoundError: a day fetched into the shared cache was evicted since
+
+        Returns:
+            Optional[np.ndarray]: flat array or None if the grid is not stored
+        """
+        if self._archive is not None:
+            return self._archive.read(date)
+        filename, filepath = self._get_filepath(date, grd_dir, "grd")
+        if self._cache is None:
+            return self.__read_grd(filepath) if self._is_complete(filepath) else None
+        with self._cache.lock(filename, shared=True):
+            if self._is_complete(filepath):
+                self._cache.use(filename)
+                return self.__read_grd(filepath)
+        if date in self._cached_days:
+            raise FileNotFoundError(
+                f"{filename} was evicted from the shared cache, fetch the data again"
+            )
+        return None
+
+    def _point_index(
+        self, lats: np.ndarray, lons: np.ndarray, method: str = "nearest"
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """indices into the flat grd array and weights of the pixels around the
+        points, points outside the grid get zero weights
+
+        Args:
+            lats (np.ndarray): latitudes of the points
+            lons (np.ndarray): longitudes of the points
+            method (str, optional): 'nearest' or 'bilinear'. Defaults to "nearest".
+
+        Raises:
+            ValueError: method is not recognized
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (k, points) flat indices and weights,
+            k is 1 for nearest and 4 for bilinear
+        """
+        y = (np.asarray(lats, "float64") - self._lat1) / self._px_size
+        x = (np.asarray(lons, "float64") - self._lon1) / self._px_size
+        inside = (
+            (y > -0.5) & (y < self._lat_size - 0.5) & (x > -0.5) & (x < self._lon_size - 0.5)
+        )
+        if method == "nearest":
+            rows = np.clip(np.rint(y), 0, self._lat_size - 1).astype("int64")
+            cols = np.clip(np.rint(x), 0, self._lon_size - 1).astype("int64")
+            idx = (rows * self._lon_size + cols)[None]
+            weights = np.ones_like(idx, "float64")
+        elif method == "bilinear":
+            y = np.clip(y, 0, self._lat_size - 1)
+            x = np.clip(x, 0, self._lon_size - 1)
+            r0 = np.minimum(np.floor(y), self._lat_size - 2).astype("int64")
+            c0 = np.minimum(np.floor(x), self._lon_size - 2).astype("int64")
+            fy, fx = y - r0, x - c0
+            base = r0 * self._lon_size + c0
+            idx = np.stack([base, base + 1, base + self._lon_size, base + self._lon_size + 1])
+            weights = np.stack([(1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx])
+        else:
+            raise ValueError(f"{method} method is not available. ('nearest', 'bilinear')")
+        idx[:, ~inside] = 0
+        weights[:, ~inside] = 0.0
+        return (idx, weights)
+
+    def _read_points(
+        self, date: datetime, grd_dir: str, idx: np.ndarray, weights: np.ndarray
+    ) -> np.ndarray:
+        """gather the values at the points from the memory mapped grd file,
+        only the pages holding the pixels are read. No data pixels are left out
+        of the weighted average.
+
+        Args:
+            date (datetime): date of the data being read
+            grd_dir (str): path to grd file
+            idx (np.ndarray): flat indices from _point_index
+            weights (np.ndarray): weights from _point_index
+
+        Returns:
+            np.ndarray: float32 values of the points, no data value where unavailable
+        """
+        undef = np.float32(self.__undef)
+        flat = self._read_flat(date, grd_dir)
+        if flat is None:
+            return np.full(idx.shape[1], undef, "float32")
+        values = flat[idx]
+        weights = np.where(values == undef, 0.0, weights)
+        total = weights.sum(axis=0)
+        out = (values * weights).sum(axis=0) / np.where(total > 0, total, 1.0)
+        return np.where(total > 0, out, undef).astype("float32")
+
+    def _missing_dates(self, start: datetime, end: datetime, grd_dir: str) -> List[datetime]:
+        """dates from start date to end date which are not stored locally
+
+        Args:
+            start (datetime): start date
+            end (datetime): end date
+            grd_dir (str): path to grd files
+
+        Returns:
+            List[datetime]: dates to be downloaded
+        """
+        return [
+            date for date in self._dtrgen(start, end) if not self._has_day(date, grd_dir)
+        ]
 
     def _dtrgen(self, start: datetime, end: datetime) -> Iterator[datetime]:
         """date range generator object from start date to end date
@@ -280,41 +847,261 @@ class IMD:
         """
         return ((start + td(days=x)) for x in range((end - start).days + 1))
     
-    def __get_futures(self, **kwargs):
-        with ProcessPoolExecutor() as ex:
-            return [
-                ex.submit(self._get_array, date, kwargs['download_path'], kwargs['out_path'])
-                for date in kwargs['date_range']
-                if f'{date:%Y-%m-%d}' not in kwargs['x_list']
-            ]
+    def _pipeline(
+        self,
+        func: Callable[[List[Any]], Any],
+        items: Iterable[Any],
+        workers: int,
+        batch_size: int,
+        max_items: Optional[int] = None,
+    ) -> Iterator[Any]:
+        """apply func to batches of items on a pool of threads, or the shared
+        executor, and yield the results in order, with at most two batches per
+        worker in flight so the consumer overlaps with the workers while memory
+        stays bounded
+
+        Args:
+            func (Callable[[List[Any]], Any]): function processing a batch of items
+            items (Iterable[Any]): items to be processed
+            workers (int): number of worker threads
+            batch_size (int): number of items in a batch
+            max_items (Optional[int]): maximum items in flight whatever the number of
+                workers, at least one batch, defaults to None.
+
+        Yields:
+            Iterator[Any]: result of func for each batch
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        it = iter(items)
+        batches = iter(lambda: list(islice(it, batch_size)), [])
+        in_flight = 2 * workers
+        if max_items is not None:
+            in_flight = max(1, min(in_flight, max_items // batch_size))
+        with nullcontext(self._executor) if self._executor else ThreadPoolExecutor(workers) as ex:
+            queue = deque(ex.submit(func, b) for b in islice(batches, in_flight))
+            while queue:
+                result = queue.popleft().result()
+                for b in islice(batches, 1):
+                    queue.append(ex.submit(func, b))
+                yield result
+
+    def __read_batch(self, dates: List[datetime], grd_dir: str, dtype: str) -> List[Tuple[datetime, np.ndarray]]:
+        return [(date, self._load_day(date, grd_dir, dtype)) for date in dates]
+
+    def __write_batch(self, dates: List[datetime], **kwargs) -> int:
+        for date in dates:
+            self._write_day(date, kwargs['download_path'], kwargs['out_path'], kwargs['profile'], kwargs['cog'])
+        return len(dates)
+
+    def _write_day(self, date: datetime, grd_dir: str, tif_dir: str, profile: dict, cog: bool = False) -> str:
+        """convert the grd file of the date to GeoTIFF
+
+        Args:
+            date (datetime): date of the data
+            grd_dir (str): path to grd file
+            tif_dir (str): path for the tif file
+            profile (dict): profile from _output_profile
+            cog (bool, optional): write as Cloud Optimized GeoTIFF. Defaults to False.
+
+        Returns:
+            str: path of the tif file
+        """
+        _, out_file, data = self._get_array(date, grd_dir, tif_dir, profile["dtype"])
+        with self._metrics.timer("geotiff", date) as t, self._open_tif(out_file, profile, cog) as dst:
+            dst.write(data, 1)
+            t.nbytes = data.nbytes
+        return out_file
+
+    def _output_profile(
+        self,
+        count: int = 1,
+        dtype: str = "float32",
+        compress: Optional[str] = None,
+        predictor: Optional[int] = None,
+        blocksize: Optional[int] = None,
+    ) -> dict:
+        """copy of the GeoTIFF profile of the window with the output options applied
+
+        Args:
+            count (int, optional): number of bands. Defaults to 1.
+            dtype (str, optional): output data type. Defaults to "float32".
+            compress (Optional[str]): compression codec like 'deflate', 'lzw' or 'zstd', defaults to None.
+            predictor (Optional[int]): 2 horizontal differencing or 3 floating point predictor, defaults to None.
+            blocksize (Optional[int]): tile size in pixels (multiple of 16), untiled if None, defaults to None.
+
+        Raises:
+            ValueError: integer data type which cannot hold the no data value exactly
+
+        Returns:
+            dict: profile for rasterio.open
+        """
+        if np.issubdtype(np.dtype(dtype), np.integer):
+            info = np.iinfo(dtype)
+            if self.__undef != round(self.__undef) or not info.min <= self.__undef <= info.max:
+                raise ValueError(
+                    f"{np.dtype(dtype).name} cannot hold the no data value {self.__undef} of "
+                    f"{self.param}, use a float data type"
+                )
+        rows, cols = self._window
+        height, width = self._shape
+        transform = self.__transform * Affine.translation(cols.start, self._lat_size - rows.stop)
+        profile = dict(
+            self._profile, count=count, dtype=np.dtype(dtype).name,
+            width=width, height=height, transform=transform,
+        )
+        pixels = height * width * count
+        if np.dtype(dtype).itemsize * pixels >= IMD.__BIGTIFF_SIZE:
+            profile.update(BIGTIFF="YES")
+        if compress:
+            profile.update(compress=compress)
+        if predictor:
+            profile.update(predictor=predictor)
+        if blocksize:
+            profile.update(tiled=True, blockxsize=blocksize, blockysize=blocksize)
+        return profile
+
+    @contextmanager
+    def _open_tif(self, out_file: str, profile: dict, cog: bool = False):
+        """open the output GeoTIFF for writing. For a Cloud Optimized GeoTIFF the
+        data is written to a temporary GeoTIFF which is then copied with the
+        COG driver to build the tiled layout and overviews.
+
+        Args:
+            out_file (str): path of the output file
+            profile (dict): profile from _output_profile
+            cog (bool, optional): write as Cloud Optimized GeoTIFF. Defaults to False.
+
+        Yields:
+            rasterio.io.DatasetWriter: dataset to write the bands to
+        """
+        import rasterio, rasterio.shutil
+
+        if not cog:
+            with rasterio.open(out_file, "w", **profile) as dst:
+                yield dst
+            return
+        tmp_file = f"{out_file}.tmp.tif"
+        try:
+            layout = ("compress", "predictor", "tiled", "blockxsize", "blockysize")
+            tmp_profile = {k: v for k, v in profile.items() if k not in layout}
+            with rasterio.open(tmp_file, "w", **tmp_profile) as dst:
+                yield dst
+            options = {
+                "compress": profile.get("compress", "NONE"),
+                "blocksize": profile.get("blockxsize", 512),
+                "overviews": "AUTO",
+                "bigtiff": profile.get("BIGTIFF", "IF_SAFER"),
+            }
+            if "predictor" in profile:
+                options["predictor"] = IMD.__COG_PREDICTOR[profile["predictor"]]
+            rasterio.shutil.copy(tmp_file, out_file, driver="COG", **options)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def _write_vrt(self, out_file: str, dates: Iterable[datetime], tif_dir: str, profile: dict) -> int:
+        """write a GDAL VRT referencing the GeoTIFF of each date as a band in
+        date order, dates without a GeoTIFF are bands of no data values. The
+        bands of an existing VRT of the same grid and data type are kept
+        without checking their files again, so extending the range only adds
+        the new days and the days converted since.
+
+        Args:
+            out_file (str): path of the VRT file
+            dates (Iterable[datetime]): dates of the bands
+            tif_dir (str): directory path of the GeoTIFF of each day
+            profile (dict): single band profile from _output_profile of the GeoTIFF files
+
+        Returns:
+            int: number of bands referencing a GeoTIFF
+        """
+        import xml.etree.ElementTree as ET
+
+        dtype = IMD.__VRT_TYPES[profile["dtype"]]
+        nodata = repr(float(profile["nodata"]))
+        grid = {"rasterXSize": str(profile["width"]), "rasterYSize": str(profile["height"])}
+        geotransform = ", ".join(repr(float(v)) for v in profile["transform"].to_gdal())
+        kept = {}
+        try:
+            old = ET.parse(out_file).getroot()
+        except (OSError, ET.ParseError):
+            old = None
+        if old is not None and dict(old.attrib) == grid and old.findtext("GeoTransform") == geotransform:
+            for band in old.iter("VRTRasterBand"):
+                if band.get("dataType") == dtype and band.find("ComplexSource") is not None:
+                    kept[band.findtext("Description")] = band
+        out_dir = os.path.dirname(os.path.abspath(out_file))
+        root = ET.Element("VRTDataset", grid)
+        ET.SubElement(root, "SRS").text = profile["crs"]
+        ET.SubElement(root, "GeoTransform").text = geotransform
+        sources = 0
+        for i, date in enumerate(dates, 1):
+            label = f"{date:%Y-%m-%d}"
+            band = kept.get(label)
+            if band is None:
+                band = ET.Element("VRTRasterBand", dataType=dtype)
+                ET.SubElement(band, "Description").text = label
+                ET.SubElement(band, "NoDataValue").text = nodata
+                _, tif_file = self._get_filepath(date, tif_dir, "tif")
+                if os.path.isfile(tif_file):
+                    self.__vrt_source(band, os.path.abspath(tif_file), out_dir, grid, nodata)
+            band.set("band", str(i))
+            sources += band.find("ComplexSource") is not None
+            root.append(band)
+        for elem in root:
+            elem.tail = "\n"
+        root.text = "\n"
+        with atomic_write(out_file) as f:
+            ET.ElementTree(root).write(f)
+        return sources
+
+    @staticmethod
+    def __vrt_source(band: Any, tif_file: str, out_dir: str, grid: Dict[str, str], nodata: str) -> None:
+        """add the first band of the GeoTIFF as the source of the VRT band, by
+        a path relative to the VRT where possible"""
+        import xml.etree.ElementTree as ET
+
+        src = ET.SubElement(band, "ComplexSource")
+        try:
+            name, relative = os.path.relpath(tif_file, out_dir), "1"
+        except ValueError:
+            name, relative = tif_file, "0"
+        ET.SubElement(src, "SourceFilename", relativeToVRT=relative).text = name
+        ET.SubElement(src, "SourceBand").text = "1"
+        rect = {"xOff": "0", "yOff": "0", "xSize": grid["rasterXSize"], "ySize": grid["rasterYSize"]}
+        ET.SubElement(src, "SrcRect", rect)
+        ET.SubElement(src, "DstRect", rect)
+        ET.SubElement(src, "NODATA").text = nodata
 
     def _to_geotiff_conversion(self, **kwargs):
-        # total_days, single, pbar, download_path, out_path, date_range, x_list
-        # start_date, end_date, skipped_downloads
+        # total_days, single, download_path, out_path, date_range, x_list
+        # start_date, end_date, skipped_downloads, profile, cog, workers, batch_size
         if kwargs['single']:
-            kwargs.update(x_list=list())
             self.__single_tif_conv(**kwargs)
         else:
             self.__tif_conv(**kwargs)
 
     def __single_tif_conv(self, **kwargs):
-        futures = self.__get_futures(**kwargs)
+        # batches of days are read by the workers while the bands are written
+        # in order, memory stays bounded irrespective of the date range
         _, out_file = self._get_filepath(kwargs['start_date'],kwargs['out_path'],'tif',kwargs['end_date'])
-        self._profile.update(count=kwargs['total_days'])
-        single_arr = np.array([])
-        for f in futures:
-            _, _, data = f.result()
-            single_arr = np.append(single_arr, data)
-        single_arr = self._transform_array(single_arr, 0, kwargs['total_days'])
-        with rasterio.open(out_file, "w", **self._profile) as dst:
-            dst.write(single_arr[::-1])
-        if kwargs['pbar']: kwargs['pbar'].update(kwargs['total_days']-len(kwargs['skipped_downloads']))
+        read = partial(self.__read_batch, grd_dir=kwargs['download_path'], dtype=kwargs['profile']['dtype'])
+        batches = self._pipeline(
+            read, kwargs['date_range'], kwargs['workers'], kwargs['batch_size'], IMD.__IN_FLIGHT_DAYS
+        )
+        with self._open_tif(out_file, kwargs['profile'], kwargs['cog']) as dst:
+            band = 0
+            for batch in batches:
+                for date, data in batch:
+                    band += 1
+                    with self._metrics.timer("geotiff", date) as t:
+                        dst.write(data, band)
+                        t.nbytes = data.nbytes
 
     def __tif_conv(self, **kwargs):
-        futures = self.__get_futures(**kwargs)
-        self._profile.update(count=1)
-        for f in as_completed(futures):
-            _, out_file, data = f.result()
-            with rasterio.open(out_file, "w", **self._profile) as dst:
-                dst.write(data, 1)
-            if kwargs['pbar']: kwargs['pbar'].update(1)
\ No newline at end of file
+        # each worker reads and writes its own batch of days
+        dates = (d for d in kwargs['date_range'] if f'{d:%Y-%m-%d}' not in kwargs['x_list'])
+        write = partial(self.__write_batch, **kwargs)
+        for _ in self._pipeline(write, dates, kwargs['workers'], kwargs['batch_size']):
+            pass
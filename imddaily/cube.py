@@ -0,0 +1,218 @@
+"""Export of the daily grids as a single chunked time x lat x lon datacube in
+Zarr or NetCDF format. New days are written in place into an existing store so
+daily updates do not rewrite the earlier data.
+
+Raises:
+    ImportError: zarr or netCDF4 is not installed
+    ValueError: data is older than the start of the existing store
+"""
+import os
+from datetime import datetime
+from datetime import timedelta as td
+from itertools import chain, groupby
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+TIME_UNITS = "days since 1970-01-01"
+
+
+def _blocks(
+    items: Iterable[Tuple[datetime, np.ndarray]], first: int, chunk: int
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """group consecutive days into blocks aligned to the time chunks, so that
+    each chunk of the store is written once
+
+    Args:
+        items (Iterable[Tuple[datetime, np.ndarray]]): consecutive dates and arrays
+        first (int): time index of the first day of the store, in days since epoch
+        chunk (int): number of days in a time chunk
+
+    Yields:
+        Iterator[Tuple[int, np.ndarray]]: time index in the store and (days, lat, lon) block
+    """
+    indexed = (((date - EPOCH).days - first, arr) for date, arr in items)
+    for _, group in groupby(indexed, key=lambda x: x[0] // chunk):
+        group = list(group)
+        yield (group[0][0], np.stack([arr for _, arr in group]))
+
+
+def _check_start(index: int, first: int) -> None:
+    if index < 0:
+        raise ValueError(
+            f"store starts on {EPOCH + td(days=first):%Y-%m-%d}, "
+            "earlier days cannot be appended"
+        )
+
+
+def _zarr_codec(zarr: Any, compression: Optional[str], level: int) -> Any:
+    if not compression:
+        return None
+    if hasattr(zarr, "codecs"):  # zarr v3
+        codecs = {
+            "zstd": lambda: zarr.codecs.ZstdCodec(level=level),
+            "blosc": lambda: zarr.codecs.BloscCodec(cname="zstd", clevel=level),
+            "gzip": lambda: zarr.codecs.GzipCodec(level=level),
+        }
+    else:
+        import numcodecs
+
+        codecs = {
+            "zstd": lambda: numcodecs.Zstd(level=level),
+            "blosc": lambda: numcodecs.Blosc(cname="zstd", clevel=level),
+            "gzip": lambda: numcodecs.GZip(level=level),
+        }
+    if compression not in codecs:
+        raise ValueError(f"{compression} compression is not available. {tuple(codecs)}")
+    return codecs[compression]()
+
+
+def _zarr_array(
+    zarr: Any, group: Any, name: str, data: np.ndarray, dims: Tuple[str, ...], attrs: Dict[str, Any], **kwargs
+) -> Any:
+    if hasattr(group, "create_array"):  # zarr v3
+        codec = kwargs.pop("compressor", None)
+        arr = group.create_array(
+            name,
+            shape=data.shape,
+            dtype=data.dtype,
+            dimension_names=dims,
+            attributes=attrs,
+            compressors=codec if codec is not None else "auto",
+            **kwargs,
+        )
+    else:
+        arr = group.create_dataset(name, shape=data.shape, dtype=data.dtype, **kwargs)
+        arr.attrs.update(attrs, _ARRAY_DIMENSIONS=list(dims))
+    if data.size:
+        arr[:] = data
+    return arr
+
+
+def write_zarr(
+    path: str,
+    param: str,
+    meta: Dict[str, Any],
+    lats: np.ndarray,
+    lons: np.ndarray,
+    items: Iterable[Tuple[datetime, np.ndarray]],
+    chunks: Tuple[int, int, int],
+    compression: Optional[str] = "zstd",
+    level: int = 3,
+) -> None:
+    """write consecutive days to a Zarr store, creating it if it does not exist
+
+    Args:
+        path (str): path of the Zarr store
+        param (str): name of the data variable
+        meta (Dict[str, Any]): units, long_name and nodata of the parameter
+        lats (np.ndarray): latitudes of the rows
+        lons (np.ndarray): longitudes of the columns
+        items (Iterable[Tuple[datetime, np.ndarray]]): consecutive dates and (lat, lon) arrays
+        chunks (Tuple[int, int, int]): chunk shape along time, lat and lon
+        compression (Optional[str], optional): 'zstd', 'blosc', 'gzip' or None. Defaults to "zstd".
+        level (int, optional): compression level. Defaults to 3.
+    """
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError("zarr is required for to_zarr, pip install imddaily[zarr]")
+    items = iter(items)
+    head = next(items, None)
+    if head is None:
+        return
+    group = zarr.open_group(path, mode="a")
+    if param not in group:
+        first = (head[0] - EPOCH).days
+        group.attrs.update(crs="EPSG:4326", source="India Meteorological Department")
+        _zarr_array(zarr, group, "lat", lats, ("lat",), {"units": "degrees_north"})
+        _zarr_array(zarr, group, "lon", lons, ("lon",), {"units": "degrees_east"})
+        _zarr_array(
+            zarr, group, "time", np.zeros(0, "int32"), ("time",),
+            {"units": TIME_UNITS, "calendar": "standard"}, chunks=(chunks[0],),
+        )
+        _zarr_array(
+            zarr, group, param, np.zeros((0, len(lats), len(lons)), "float32"),
+            ("time", "lat", "lon"),
+            {"units": meta["units"], "long_name": meta["long_name"]},
+            chunks=chunks, fill_value=meta["nodata"],
+            compressor=_zarr_codec(zarr, compression, level),
+        )
+    else:
+        first = int(group["time"][0])
+    time, var = group["time"], group[param]
+    for index, block in _blocks(chain([head], items), first, chunks[0]):
+        _check_start(index, first)
+        end = index + len(block)
+        size = var.shape[0]
+        if end > size:
+            var.resize((end, *var.shape[1:]))
+            time.resize((end,))
+            time[size:end] = np.arange(first + size, first + end, dtype="int32")
+        var[index:end] = block
+
+
+def write_netcdf(
+    path: str,
+    param: str,
+    meta: Dict[str, Any],
+    lats: np.ndarray,
+    lons: np.ndarray,
+    items: Iterable[Tuple[datetime, np.ndarray]],
+    chunks: Tuple[int, int, int],
+    compression: Optional[str] = "zlib",
+    level: int = 4,
+) -> None:
+    """write consecutive days to a NetCDF4 file with an unlimited time
+    dimension, creating it if it does not exist
+
+    Args:
+        path (str): path of the NetCDF file
+        param (str): name of the data variable
+        meta (Dict[str, Any]): units, long_name and nodata of the parameter
+        lats (np.ndarray): latitudes of the rows
+        lons (np.ndarray): longitudes of the columns
+        items (Iterable[Tuple[datetime, np.ndarray]]): consecutive dates and (lat, lon) arrays
+        chunks (Tuple[int, int, int]): chunk shape along time, lat and lon
+        compression (Optional[str], optional): 'zlib', 'zstd' or None. Defaults to "zlib".
+        level (int, optional): compression level. Defaults to 4.
+    """
+    try:
+        import netCDF4
+    except ImportError:
+        raise ImportError("netCDF4 is required for to_netcdf, pip install imddaily[netcdf]")
+    items = iter(items)
+    head = next(items, None)
+    if head is None:
+        return
+    exists = os.path.isfile(path)
+    with netCDF4.Dataset(path, "a" if exists else "w") as ds:
+        if not exists:
+            ds.setncatts({"Conventions": "CF-1.8", "source": "India Meteorological Department"})
+            ds.createDimension("time", None)
+            ds.createDimension("lat", len(lats))
+            ds.createDimension("lon", len(lons))
+            time = ds.createVariable("time", "i4", ("time",))
+            time.setncatts({"units": TIME_UNITS, "calendar": "standard"})
+            lat = ds.createVariable("lat", "f8", ("lat",))
+            lat.units = "degrees_north"
+            lat[:] = lats
+            lon = ds.createVariable("lon", "f8", ("lon",))
+            lon.units = "degrees_east"
+            lon[:] = lons
+            var = ds.createVariable(
+                param, "f4", ("time", "lat", "lon"),
+                compression=compression, complevel=level, chunksizes=chunks,
+                fill_value=meta["nodata"],
+            )
+            var.setncatts({"units": meta["units"], "long_name": meta["long_name"]})
+        time, var = ds["time"], ds[param]
+        var.set_auto_mask(False)
+        first = int(time[0]) if len(time) else (head[0] - EPOCH).days
+        for index, block in _blocks(chain([head], items), first, chunks[0]):
+            _check_start(index, first)
+            end = index + len(block)
+            size = len(time)
+            var[index:end] = block
+            if end > size:
+                time[size:end] = np.arange(first + size, first + end, dtype="int32")
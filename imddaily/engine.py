@@ -0,0 +1,147 @@
+"""Asyncio download engine of the imddaily package which bounds the number of
+downloads in flight and the rate at which they are started, and the bounded
+stage which hands downloaded days to the next step while downloads continue.
+"""
+import asyncio, queue, threading, time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, Callable, Coroutine, Iterable, List, Optional
+
+
+class RateLimiter:
+    """spaces out the start of requests so that no more than rate requests are
+    started per second. Retries are made by the session (urllib3) within a
+    request and are not spaced out by the limiter.
+
+    Args:
+        rate (Optional[float]): requests per second, None or 0 for no limit
+    """
+
+    def __init__(self, rate: Optional[float] = None) -> None:
+        self.interval = 1.0 / rate if rate else 0.0
+        self.__next = 0.0
+
+    async def wait(self) -> None:
+        """wait for the next free slot"""
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self.__next)
+        self.__next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def _download_all(
+    func: Callable[[datetime], Any],
+    dates: Iterable[datetime],
+    callback: Callable[[Any], None],
+    max_in_flight: int,
+    rate: Optional[float],
+    executor: Optional[Executor],
+) -> None:
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_in_flight)
+    limiter = RateLimiter(rate)
+
+    async def one(date: datetime) -> None:
+        async with semaphore:
+            await limiter.wait()
+            callback(await loop.run_in_executor(ex, func, date))
+
+    with nullcontext(executor) if executor else ThreadPoolExecutor(max_in_flight) as ex:
+        await asyncio.gather(*(one(date) for date in dates))
+
+
+def _run(coro: Coroutine) -> Any:
+    """run the coroutine to completion, in a separate thread if an event loop
+    is already running (e.g. in a notebook)"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        return ex.submit(asyncio.run, coro).result()
+
+
+def download(
+    func: Callable[[datetime], Any],
+    dates: Iterable[datetime],
+    callback: Callable[[Any], None],
+    max_in_flight: int = 10,
+    rate: Optional[float] = None,
+    executor: Optional[Executor] = None,
+) -> None:
+    """download the dates with func on an asyncio event loop, with at most
+    max_in_flight downloads running and at most rate downloads started per
+    second. callback receives the result of each download as it completes.
+
+    Args:
+        func (Callable[[datetime], Any]): blocking download function for a date
+        dates (Iterable[datetime]): dates to be downloaded
+        callback (Callable[[Any], None]): called with each result on completion
+        max_in_flight (int, optional): maximum concurrent downloads. Defaults to 10.
+        rate (Optional[float]): maximum downloads started per second, retries within a download
+            are not counted, defaults to None.
+        executor (Optional[Executor]): thread pool running the downloads, defaults to a new pool.
+    """
+    _run(_download_all(func, dates, callback, max_in_flight, rate, executor))
+
+
+class Stage:
+    """pool of threads applying func to the items put into a bounded queue,
+    put blocks while the queue is full so a slow stage holds back the
+    producer instead of buffering without limit. The first error raised by
+    func is raised again on close.
+
+    Args:
+        func (Callable[..., Any]): function called with the arguments of each item
+        workers (int, optional): number of threads. Defaults to 2.
+        maxsize (Optional[int]): size of the queue, defaults to twice the workers.
+    """
+
+    __STOP = object()
+
+    def __init__(
+        self, func: Callable[..., Any], workers: int = 2, maxsize: Optional[int] = None
+    ) -> None:
+        self.func = func
+        self.__queue: queue.Queue = queue.Queue(maxsize or 2 * workers)
+        self.__errors: List[BaseException] = []
+        self.__threads = [
+            threading.Thread(target=self.__work, daemon=True) for _ in range(workers)
+        ]
+        for t in self.__threads:
+            t.start()
+
+    def __work(self) -> None:
+        while True:
+            item = self.__queue.get()
+            if item is Stage.__STOP:
+                return
+            if self.__errors:
+                continue
+            try:
+                self.func(*item)
+            except BaseException as e:
+                self.__errors.append(e)
+
+    def put(self, *args: Any) -> None:
+        """queue the arguments of a call of func, waiting while the queue is full"""
+        self.__queue.put(args)
+
+    def close(self) -> None:
+        """wait for the queued items to be processed"""
+        for _ in self.__threads:
+            self.__queue.put(Stage.__STOP)
+        for t in self.__threads:
+            t.join()
+        if self.__errors:
+            raise self.__errors[0]
+
+    def __enter__(self) -> "Stage":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -0,0 +1,39 @@
+"""File writing shared by the modules of the imddaily package. Files which other
+threads or processes may read while they are written, like the grd files, the
+manifest, the catalog and the archive index, are written to a temporary file
+in the same directory and renamed over the target once complete.
+"""
+import os, tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+# the umask can only be read by setting it, read once on import
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb") -> Iterator[IO]:
+    """write the file through a temporary file which is renamed to path only
+    if the block completes, so readers never see a partial file. The file
+    gets the permissions of a file created with open, not the private
+    permissions of the temporary file.
+
+    Args:
+        path (str): path of the file
+        mode (str, optional): 'wb' or 'w'. Defaults to "wb".
+
+    Yields:
+        Iterator[IO]: temporary file to write to
+    """
+    fd, tmp_file = tempfile.mkstemp(
+        suffix=".part", prefix=f"{os.path.basename(path)}.", dir=os.path.dirname(path) or "."
+    )
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(tmp_file, 0o666 & ~_UMASK)
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
@@ -1,14 +1,28 @@
 """Main file of the imddaily package while organizes all the functionalities like
 download and convert the real time data from IMD.
 """
-from typing import List
-from .core import IMD
-from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
-import rasterio
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from .core import IMD, _new_session
+from . import cube as _cube
+from . import aggregate as _agg
+from . import regrid as _regrid
+from .metrics import NOOP, Metrics, Progress, Tee
+from .catalog import Catalog
+from .cache import Cache
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+import os
 import numpy as np
 
+# the download engine, executors, requests and rasterio are imported when
+# data is downloaded or converted so that inspection stays cheap
+if TYPE_CHECKING:
+    import requests
+    from concurrent.futures import Executor
+
 __version__ = "0.3.0"
+_IMDPARAMS = ("raingpm", "tmax", "tmin", "rain", "tmaxone", "tminone")
 
 
 class get_data:
@@ -22,14 +36,63 @@ class get_data:
         end_date (str): end date for data
         path (str): directory path to save the downloaded data
         quiet (bool, optional): when True does not display Progress Bar. Defaults to False.
+        pool_size (int, optional): number of download threads and pooled connections. Defaults to 10.
+        retries (int, optional): retries for connection errors and 5xx responses. Defaults to 3.
+        backoff (float, optional): exponential backoff factor in seconds between retries. Defaults to 0.5.
+        timeout (Tuple[float, float], optional): connect and read timeout in seconds. Defaults to (10, 60).
+        base_url (Optional[str]): url of a mirror of the IMD real time data, defaults to None.
+        engine (str, optional): 'thread' or 'async' download engine. Defaults to 'thread'.
+        max_in_flight (Optional[int]): maximum concurrent downloads of the async engine, defaults to pool_size.
+        rate_limit (Optional[float]): maximum requests started per second by the async engine, retries
+            of a request by the session are not counted against the limit, defaults to None.
+        resume (bool, optional): only transfer missing, truncated or changed files, using conditional
+            requests and a manifest of validators in path. Defaults to False.
+        bbox (Optional[Tuple[float, float, float, float]]): min lon, min lat, max lon, max lat to
+            read and convert only that window of the grid, defaults to None.
+        geotiff_path (Optional[str]): directory path to convert each day to GeoTIFF as soon as it
+            is downloaded, overlapping conversion with the downloads, defaults to None.
+        geotiff_options (Optional[Dict[str, Any]]): dtype, compress, predictor, blocksize and cog
+            of the GeoTIFF files of geotiff_path as in to_geotiff, defaults to None.
+        sink (Optional[Callable[[datetime, str], Any]]): called with the date and .grd file path of
+            each day as soon as it is downloaded, or the archive file path with archive, defaults to None.
+        sink_workers (int, optional): number of threads converting or running the sink, no new
+            download starts while two days per thread are waiting for the sink. Defaults to 2.
+        session (Optional[requests.Session]): session shared with other parameters, defaults to a
+            new session from pool_size, retries and backoff.
+        executor (Optional[Executor]): thread pool shared with other parameters for downloads and
+            conversions, defaults to a new pool.
+        catalog (bool, optional): keep a catalog of the published days in path and skip the
+            days known to be unpublished without requesting them. Defaults to False.
+        catalog_ttl (float, optional): seconds after which a day found unpublished is requested
+            again. Defaults to 86400.
+        archive (bool, optional): store the days in one append-only archive of the parameter in
+            path instead of a .grd file per day, read as a single memory map, see
+            imddaily.archive. Days in the archive are not downloaded again, with resume a revised
+            day is appended. Only one process may write an archive at a time. Defaults to False.
+        cache (bool, optional): use path as a download cache shared by several processes, each
+            .grd file is downloaded under a lock, fresh files are reused and the cache is evicted
+            after the download, see imddaily.cache. Defaults to False.
+        cache_max_bytes (Optional[int]): total size of the .grd files kept in the cache, the
+            oldest files outside the range are evicted, defaults to None.
+        cache_max_age (Optional[float]): seconds after which a cached .grd file is downloaded
+            again and evicted, defaults to None.
+        cache_grace (float, optional): seconds after its last use during which a cached .grd
+            file is not evicted by other jobs, so the days fetched stay readable. Days evicted
+            after that raise FileNotFoundError when read. Defaults to 3600.
+        download (bool, optional): download on initialization, when False nothing is requested
+            until fetch is called and skipped_downloads lists the days missing in path.
+            Defaults to True.
+        metrics (Optional[Metrics]): sink receiving the timing of the fetch, write, read,
+            transform and geotiff stages of each day, see imddaily.metrics, defaults to None.
 
     Raises:
         ValueError: provided parameter is not recognized
         OSError: path does not exist
         ValueError: incorrect Date Format or Data for date not available
+        ValueError: cache is combined with archive
     """
 
-    __IMDPARAMS = ("raingpm", "tmax", "tmin", "rain", "tmaxone", "tminone")
+    __IMDPARAMS = _IMDPARAMS
 
     def __init__(
         self,
@@ -38,6 +101,31 @@ class get_data:
         end_date: str,
         path: str,
         quiet: bool = False,
+        pool_size: int = 10,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: Tuple[float, float] = (10, 60),
+        base_url: Optional[str] = None,
+        engine: str = "thread",
+        max_in_flight: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        resume: bool = False,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        geotiff_path: Optional[str] = None,
+        geotiff_options: Optional[Dict[str, Any]] = None,
+        sink: Optional[Callable[[datetime, str], Any]] = None,
+        sink_workers: int = 2,
+        session: Optional["requests.Session"] = None,
+        executor: Optional["Executor"] = None,
+        metrics: Optional[Metrics] = None,
+        catalog: bool = False,
+        catalog_ttl: float = 86400.0,
+        archive: bool = False,
+        cache: bool = False,
+        cache_max_bytes: Optional[int] = None,
+        cache_max_age: Optional[float] = None,
+        cache_grace: float = 3600.0,
+        download: bool = True,
     ) -> None:
         if parameter in get_data.__IMDPARAMS:
             self.param = parameter
@@ -45,69 +133,575 @@ class get_data:
             raise ValueError(
                 f"{parameter} is not available in IMD. {get_data.__IMDPARAMS}"
             )
-        self.__imd = IMD(self.param)
+        if cache and archive:
+            raise ValueError("cache shares the .grd files and cannot be combined with archive")
+        if engine not in ("thread", "async"):
+            raise ValueError(f"{engine} engine is not available. ('thread', 'async')")
+        self.engine = engine
+        self.pool_size = pool_size
+        self.max_in_flight = max_in_flight or pool_size
+        self.rate_limit = rate_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.executor = executor
+        self.__imd = IMD(self.param, session, timeout, base_url, executor)
+        self.metrics = metrics
+        # readers report to the sink too, also without a download
+        self.__imd._metrics = metrics or NOOP
+        if bbox:
+            self.__imd._window = self.__imd._bbox_window(bbox)
+        self.bbox = bbox
         self.start_date, self.end_date = self.__imd._check_dates(start_date, end_date)
         self.download_path = self.__imd._checked_path(path)
         self.quiet = quiet
+        self.resume = resume
+        self.geotiff_path = self.__imd._checked_path(geotiff_path) if geotiff_path else None
+        options = dict(geotiff_options or {})
+        self.__tif_cog = options.pop("cog", False)
+        self.__tif_profile = self.__imd._output_profile(1, **options)
+        self.sink = sink
+        self.sink_workers = sink_workers
+        self.catalog = Catalog(self.__imd, self.download_path, catalog_ttl) if catalog else None
+        self.archive = self.__imd._open_archive(self.download_path) if archive else None
+        self.cache = (
+            Cache(self.download_path, cache_max_bytes, cache_max_age, cache_grace) if cache else None
+        )
+        self.__imd._cache = self.cache
         self.total_days = (self.end_date - self.start_date).days + 1
+        self.failed_downloads: List[str] = []
+        if download:
+            self.fetch()
+        else:
+            self.skipped_downloads = [
+                f"{d:%Y-%m-%d}"
+                for d in self.__imd._missing_dates(self.start_date, self.end_date, self.download_path)
+            ]
+
+    def fetch(self) -> "get_data":
+        """download the data from start date to end date, called on
+        initialization unless download is False
+
+        Raises:
+            OSError: no data could be downloaded
+
+        Returns:
+            get_data: the object itself
+        """
+        self.__imd._connect(max(self.pool_size, self.max_in_flight), self.retries, self.backoff)
+        self.failed_downloads = []
         self.skipped_downloads = self.__download()
+        if self.cache is not None:
+            dates = self.__imd._dtrgen(self.start_date, self.end_date)
+            self.cache.evict(self.__imd._get_filepath(d, self.download_path, "grd")[1] for d in dates)
         if self.total_days == len(self.skipped_downloads):
             raise IOError(f'{self.param} data unavailable or inaccessible')
+        return self
+
+    def available_dates(self, workers: Optional[int] = None) -> List[str]:
+        """dates of the range published on the server, from the catalog with
+        HEAD probes of the days which are unknown or expired, without
+        downloading them. Uses the catalog of get_data or a catalog in path.
+
+        Args:
+            workers (Optional[int]): number of concurrent probes, defaults to pool_size.
+
+        Returns:
+            List[str]: available dates
+        """
+        catalog = self.catalog or Catalog(self.__imd, self.download_path)
+        dates = list(self.__imd._dtrgen(self.start_date, self.end_date))
+        self.__imd._connect(self.pool_size, self.retries, self.backoff)
+        catalog.refresh(dates, workers or self.pool_size)
+        catalog.save()
+        return [f"{d:%Y-%m-%d}" for d in catalog.available(dates)]
 
     def __download(self) -> List[str]:
         """When get_data initiated download of data from start date to end date
         will be carried out.
 
+        Dates which are not published (404) and dates which failed after all
+        retries are both skipped, the latter are also listed in failed_downloads.
+
         Returns:
-            List[str]: list of filenames for which download failed
+            List[str]: list of dates for which download failed
         """
-        date_range = self.__imd._dtrgen(self.start_date, self.end_date)
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        from . import engine as _engine
+
+        date_range = list(self.__imd._dtrgen(self.start_date, self.end_date))
         output = []
-        with ThreadPoolExecutor() as ex:
-            futures = [
-                ex.submit(self.__imd._download_grd, dt, self.download_path)
-                for dt in date_range
-            ]
-        if self.quiet:
-            for f in as_completed(futures):
-                value = f.result()
-                if value is not None:
-                    output.append(value)
-        else:
-            with tqdm(total=self.total_days) as pbar:
-                for f in as_completed(futures):
-                    value = f.result()
+        catalog = self.catalog
+        if catalog is not None:
+            # days known to be unpublished are skipped without a request
+            output = [f"{d:%Y-%m-%d}" for d in date_range if catalog.status(d) is False]
+            date_range = [d for d in date_range if catalog.status(d) is not False]
+        if self.resume:
+            self.__imd._load_manifest(self.download_path)
+        # the manifest, catalog and archive index are saved even when a sink or
+        # conversion fails, they describe the days already downloaded
+        try:
+            with self.__instrumented("fetch", len(date_range)), _engine.Stage(
+                self.__handoff, self.sink_workers
+            ) as stage:
+
+                def download(date: datetime) -> Tuple[datetime, Optional[Tuple[str, Optional[int]]]]:
+                    return (date, self.__imd._download_grd(date, self.download_path))
+
+                def collect(result: Tuple[datetime, Optional[Tuple[str, Optional[int]]]]) -> None:
+                    date, value = result
+                    if catalog is not None and (value is None or value[1] == 404):
+                        catalog.record(date, value is None)
                     if value is not None:
-                        output.append(value)
-                    pbar.update(1)
-        return output
+                        day, status = value
+                        output.append(day)
+                        if status != 404:
+                            self.failed_downloads.append(day)
+                    elif self.geotiff_path or self.sink:
+                        stage.put(date)
+
+                if self.engine == "async":
+                    _engine.download(
+                        download, date_range, collect, self.max_in_flight, self.rate_limit,
+                        self.executor,
+                    )
+                else:
+                    with nullcontext(self.executor) if self.executor else ThreadPoolExecutor(
+                        self.pool_size
+                    ) as ex:
+                        # pool_size downloads in flight, the next one is submitted when a
+                        # result is collected so a full sink stage holds back the downloads
+                        dates = iter(date_range)
+                        pending = {ex.submit(download, dt) for dt in islice(dates, self.pool_size)}
+                        while pending:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for f in done:
+                                collect(f.result())
+                                pending.update(ex.submit(download, dt) for dt in islice(dates, 1))
+        finally:
+            if self.resume:
+                self.__imd._save_manifest(self.download_path)
+            if catalog is not None:
+                catalog.save()
+            if self.archive is not None:
+                self.archive.close()
+        return sorted(output)
+
+    def _detach(self) -> None:
+        """stop using the thread pool and session shared by get_batch, later
+        downloads and conversions use their own"""
+        self.executor = None
+        self.__imd._executor = None
+        self.__imd._session = None
+
+    @contextmanager
+    def __instrumented(self, stage: str, total: int) -> Iterator[None]:
+        """report the stages to the metrics sink and to a progress bar of the
+        given stage while the block runs"""
+        progress = Progress(stage, total, disable=self.quiet)
+        self.__imd._metrics = Tee(self.metrics, progress)
+        try:
+            yield
+        finally:
+            self.__imd._metrics = self.metrics or NOOP
+            progress.close()
 
-    def to_geotiff(self, path: str, single: bool = False) -> None:
+    def __handoff(self, date: datetime) -> None:
+        """convert a day and pass it to the sink as soon as it is downloaded,
+        run on the threads of the sink stage while the downloads continue"""
+        if self.geotiff_path:
+            self.__imd._write_day(
+                date, self.download_path, self.geotiff_path, self.__tif_profile, self.__tif_cog
+            )
+        if self.sink:
+            if self.archive is not None:
+                grd_file = self.archive.data_path
+            else:
+                _, grd_file = self.__imd._get_filepath(date, self.download_path, "grd")
+            self.sink(date, grd_file)
+
+    def to_geotiff(
+        self,
+        path: str,
+        single: bool = False,
+        dtype: str = "float32",
+        compress: Optional[str] = None,
+        predictor: Optional[int] = None,
+        blocksize: Optional[int] = None,
+        cog: bool = False,
+        workers: Optional[int] = None,
+        batch_size: int = 8,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        vrt: bool = False,
+    ) -> None:
         """conversion of downloaded grd data to geotiff format.
 
         Args:
             path (str): directory path to save the converted files
             single (bool): save as single tif file with daily data as bands
+            dtype (str, optional): output data type, values are rounded for integer types.
+                Defaults to "float32".
+            compress (Optional[str]): compression codec like 'deflate', 'lzw' or 'zstd', defaults to None.
+            predictor (Optional[int]): 2 horizontal differencing or 3 floating point predictor, defaults to None.
+            blocksize (Optional[int]): tile size in pixels (multiple of 16), defaults to None.
+            cog (bool, optional): write Cloud Optimized GeoTIFF with overviews. Defaults to False.
+            workers (Optional[int]): number of conversion threads, defaults to the number of cpus.
+            batch_size (int, optional): number of days handled by a worker at a time, with single
+                at most 16 days or one batch are read ahead of the writer. Defaults to 8.
+            bbox (Optional[Tuple[float, float, float, float]]): min lon, min lat, max lon, max lat
+                to convert only that window, defaults to the bbox of get_data.
+            vrt (bool, optional): also write a VRT time stack of the daily files, see to_vrt.
+                Defaults to False.
+
+        Raises:
+            ValueError: vrt with single, the VRT references the daily files
+            ValueError: integer dtype which cannot hold the no data value, like the 99.9 of
+                the temperatures
         """
+        if vrt and single:
+            raise ValueError("vrt references the daily files, use single=False")
         date_range = self.__imd._dtrgen(self.start_date, self.end_date)
-        kwargs = {
-            'total_days': self.total_days,
-            'single': single,
-            'download_path': self.download_path,
-            'out_path': path,
-            'date_range': date_range,
-            'skipped_downloads': self.skipped_downloads,
-            'x_list': self.skipped_downloads,
-            'start_date': self.start_date,
-            'end_date': self.end_date
-        }
-        if self.quiet:
-            kwargs.update(pbar=None)
-            self.__imd._to_geotiff_conversion(**kwargs)
-        else:
-            with tqdm(total=(self.total_days-len(self.skipped_downloads))) as pbar:
-                kwargs.update(pbar=pbar)
+        count = self.total_days if single else 1
+        with self.__imd._subset(bbox):
+            kwargs = {
+                'profile': self.__imd._output_profile(count, dtype, compress, predictor, blocksize),
+                'cog': cog,
+                'workers': workers or os.cpu_count() or 1,
+                'batch_size': batch_size,
+                'total_days': self.total_days,
+                'single': single,
+                'download_path': self.download_path,
+                'out_path': path,
+                'date_range': date_range,
+                'skipped_downloads': self.skipped_downloads,
+                'x_list': self.skipped_downloads,
+                'start_date': self.start_date,
+                'end_date': self.end_date
+            }
+            total = self.total_days if single else self.total_days - len(self.skipped_downloads)
+            with self.__instrumented("geotiff", total):
                 self.__imd._to_geotiff_conversion(**kwargs)
+        if vrt:
+            self.to_vrt(path, dtype=dtype, bbox=bbox)
+
+    def to_vrt(
+        self,
+        path: str,
+        tif_path: Optional[str] = None,
+        dtype: str = "float32",
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        label: str = "stack",
+    ) -> str:
+        """write a GDAL VRT time stack referencing the daily GeoTIFF files of
+        to_geotiff as bands in date order, without copying any data. Days
+        without a GeoTIFF are bands of no data values. Writing it again for an
+        extended range keeps the existing bands and only adds the new days.
+
+        Args:
+            path (str): directory path to save the VRT file
+            tif_path (Optional[str]): directory path of the daily GeoTIFF files, defaults to path.
+            dtype (str, optional): data type of the GeoTIFF files. Defaults to "float32".
+            bbox (Optional[Tuple[float, float, float, float]]): window of the GeoTIFF files,
+                defaults to the bbox of get_data.
+            label (str, optional): name of the VRT after the parameter prefix. Defaults to "stack".
+
+        Returns:
+            str: path of the VRT file
+        """
+        self.__imd._checked_path(path)
+        _, out_file = self.__imd._get_labelpath(label, path, "vrt")
+        with self.__imd._subset(bbox):
+            profile = self.__imd._output_profile(1, dtype)
+        dates = self.__imd._dtrgen(self.start_date, self.end_date)
+        self.__imd._write_vrt(out_file, dates, tif_path or path, profile)
+        return out_file
+
+    def iter_arrays(self) -> Iterator[Tuple[datetime, np.ndarray]]:
+        """iterate over the downloaded data as north up numpy arrays, memory
+        mapped from the grd files. Days without data are filled with no data
+        values.
+
+        Raises:
+            FileNotFoundError: a day fetched into the shared cache was evicted since
+
+        Yields:
+            Iterator[Tuple[datetime, np.ndarray]]: date and (lat, lon) array
+        """
+        for date in self.__imd._dtrgen(self.start_date, self.end_date):
+            yield (date, self.__imd._load_day(date, self.download_path, None))
+
+    def to_array(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """stack the downloaded data as a numpy cube with the coordinates of
+        the pixel centres. Days without data are filled with no data values.
+
+        Raises:
+            FileNotFoundError: a day fetched into the shared cache was evicted since
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: (days, lat, lon) float32 cube,
+            latitudes (north to south) and longitudes (west to east)
+        """
+        cube = np.empty((self.total_days, *self.__imd._shape), "float32")
+        for idx, (_, arr) in enumerate(self.iter_arrays()):
+            cube[idx] = arr
+        return (cube, *self.__imd._coords())
+
+    def regrid(
+        self,
+        target: Union[str, Tuple[np.ndarray, np.ndarray]],
+        method: str = "bilinear",
+        cache_dir: Optional[str] = None,
+        batch_size: int = 64,
+    ) -> Iterator[Tuple[datetime, np.ndarray]]:
+        """iterate over the downloaded data regridded onto the full grid of
+        another parameter or a user grid. The weights are computed once per
+        pair of grids, cached in cache_dir, and applied to batches of days.
+
+        Args:
+            target (Union[str, Tuple[np.ndarray, np.ndarray]]): parameter like 'tmax', or
+                latitudes (north to south) and longitudes (west to east) of the pixel centres
+            method (str, optional): 'nearest', 'bilinear' or 'conservative'. Defaults to "bilinear".
+            cache_dir (Optional[str]): directory to cache the weights, defaults to None.
+            batch_size (int, optional): number of days regridded at once. Defaults to 64.
+
+        Raises:
+            ValueError: method is not recognized
+
+        Yields:
+            Iterator[Tuple[datetime, np.ndarray]]: date and (lat, lon) float32 array on the target
+            grid, no data value outside the source grid
+        """
+        dst_lats, dst_lons = _regrid.coords(target) if isinstance(target, str) else target
+        weights = _regrid.Weights.cached(
+            method, *self.__imd._coords(), dst_lats, dst_lons, cache_dir
+        )
+        nodata = self.nodata
+        items = self.iter_arrays()
+        for batch in iter(lambda: list(islice(items, batch_size)), []):
+            dates = [date for date, _ in batch]
+            yield from zip(dates, weights.apply(np.stack([arr for _, arr in batch]), nodata))
+
+    def to_zarr(
+        self,
+        path: str,
+        chunks: Optional[Tuple[int, int, int]] = None,
+        compression: Optional[str] = "zstd",
+        level: int = 3,
+    ) -> None:
+        """export the downloaded data as a time x lat x lon Zarr store. When the
+        store exists the days are written in place, extending the time axis if
+        needed, without rewriting the other days. Requires zarr.
+
+        Args:
+            path (str): path of the Zarr store
+            chunks (Optional[Tuple[int, int, int]]): chunk shape along time, lat and lon,
+                defaults to 32 days of the full grid.
+            compression (Optional[str], optional): 'zstd', 'blosc', 'gzip' or None. Defaults to "zstd".
+            level (int, optional): compression level. Defaults to 3.
+        """
+        lats, lons = self.__imd._coords()
+        chunks = chunks or (32, len(lats), len(lons))
+        _cube.write_zarr(
+            path, self.param, self.__imd._meta(), lats, lons, self.iter_arrays(),
+            chunks, compression, level,
+        )
+
+    def to_netcdf(
+        self,
+        path: str,
+        chunks: Optional[Tuple[int, int, int]] = None,
+        compression: Optional[str] = "zlib",
+        level: int = 4,
+    ) -> None:
+        """export the downloaded data as a time x lat x lon NetCDF4 file with an
+        unlimited time dimension. When the file exists the days are written in
+        place, extending the time axis if needed. Requires netCDF4.
+
+        Args:
+            path (str): path of the NetCDF file
+            chunks (Optional[Tuple[int, int, int]]): chunk shape along time, lat and lon,
+                defaults to 32 days of the full grid.
+            compression (Optional[str], optional): 'zlib', 'zstd' or None. Defaults to "zlib".
+            level (int, optional): compression level. Defaults to 4.
+        """
+        lats, lons = self.__imd._coords()
+        chunks = chunks or (32, len(lats), len(lons))
+        _cube.write_netcdf(
+            path, self.param, self.__imd._meta(), lats, lons, self.iter_arrays(),
+            chunks, compression, level,
+        )
+
+    def extract_points(
+        self,
+        lats: Sequence[float],
+        lons: Sequence[float],
+        method: str = "nearest",
+        workers: Optional[int] = None,
+    ) -> Tuple[List[datetime], np.ndarray]:
+        """extract the daily values at the given locations. The locations are
+        mapped to grid pixels once and only the needed bytes of the memory
+        mapped grd files are read.
+
+        Args:
+            lats (Sequence[float]): latitudes of the locations
+            lons (Sequence[float]): longitudes of the locations
+            method (str, optional): 'nearest' or 'bilinear'. Defaults to "nearest".
+            workers (Optional[int]): number of reading threads, defaults to the number of cpus.
+
+        Raises:
+            ValueError: method is not recognized
+
+        Returns:
+            Tuple[List[datetime], np.ndarray]: dates and (days, locations) float32 values,
+            no data value for days without data or locations outside the grid
+        """
+        idx, weights = self.__imd._point_index(lats, lons, method)
+
+        def read(dates: List[datetime]) -> List[np.ndarray]:
+            return [
+                self.__imd._read_points(date, self.download_path, idx, weights)
+                for date in dates
+            ]
+
+        dates = list(self.__imd._dtrgen(self.start_date, self.end_date))
+        values = np.empty((len(dates), idx.shape[1]), "float32")
+        row = 0
+        for batch in self.__imd._pipeline(read, dates, workers or os.cpu_count() or 1, 32):
+            values[row : row + len(batch)] = batch
+            row += len(batch)
+        return (dates, values)
+
+    def zonal_stats(
+        self,
+        geometries: Sequence[Any],
+        stats: Sequence[str] = ("mean",),
+        cache_dir: Optional[str] = None,
+        supersample: int = 10,
+        workers: Optional[int] = None,
+    ) -> Tuple[List[datetime], Dict[str, np.ndarray]]:
+        """daily statistics of the data over the polygons. The fraction of each
+        pixel covered by each polygon is computed once and cached in cache_dir,
+        each day is then aggregated with a sparse product.
+
+        Args:
+            geometries (Sequence[Any]): GeoJSON like polygons in EPSG:4326
+            stats (Sequence[str], optional): any of 'mean', 'weighted_mean', 'sum', 'min', 'max'.
+                Defaults to ("mean",).
+            cache_dir (Optional[str]): directory to cache the pixel weights, defaults to None.
+            supersample (int, optional): subdivisions of a pixel to estimate the coverage. Defaults to 10.
+            workers (Optional[int]): number of reading threads, defaults to the number of cpus.
+
+        Raises:
+            ValueError: statistic is not recognized
+
+        Returns:
+            Tuple[List[datetime], Dict[str, np.ndarray]]: dates and (days, polygons) float32
+            values of each statistic, no data value where a polygon has no valid pixels
+        """
+        from .zonal import PixelWeights, STATS
+
+        if set(stats) - set(STATS):
+            raise ValueError(f"{set(stats) - set(STATS)} statistic is not available. {STATS}")
+        shape = (self.__imd._lat_size, self.__imd._lon_size)
+        weights = PixelWeights.cached(
+            geometries, self.__imd._profile["transform"], shape, cache_dir, supersample
+        )
+        nodata = self.__imd._meta()["nodata"]
+
+        def read(dates: List[datetime]) -> List[Dict[str, np.ndarray]]:
+            return [
+                weights.stats(self.__imd._read_flat(date, self.download_path), nodata, stats)
+                for date in dates
+            ]
+
+        dates = list(self.__imd._dtrgen(self.start_date, self.end_date))
+        out = {s: np.empty((len(dates), weights.n_zones), "float32") for s in stats}
+        row = 0
+        for batch in self.__imd._pipeline(read, dates, workers or os.cpu_count() or 1, 32):
+            for day in batch:
+                for s in stats:
+                    out[s][row] = day[s]
+                row += 1
+        return (dates, out)
+
+    def aggregate(self, freq: str = "M", stat: str = "sum") -> Iterator[Tuple[str, np.ndarray]]:
+        """aggregate the daily data into periods in a single pass, each period
+        is yielded as soon as its last day is read. No data values are left out.
+
+        Args:
+            freq (str, optional): 'D', 'M', 'Y' or a season as consecutive month initials
+                like 'JJAS' or 'DJF'. Defaults to "M".
+            stat (str, optional): 'sum', 'mean', 'min', 'max', 'std' or 'count'. Defaults to "sum".
+
+        Raises:
+            ValueError: frequency or statistic is not recognized
+
+        Yields:
+            Iterator[Tuple[str, np.ndarray]]: label (YYYYMM, YYYY, YYYY<season> or
+            YYYYMMDD) and north up float32 grid of each period
+        """
+        nodata = self.__imd._meta()["nodata"]
+        for label, _, arr in _agg.aggregate(self.iter_arrays(), freq, stat, nodata):
+            yield (label, arr)
+
+    def climatology(self, freq: str = "M", stat: str = "sum") -> Dict[str, np.ndarray]:
+        """mean over the years of the periods, like the mean monthly total or
+        with freq 'D' the mean of each day of the year
+
+        Args:
+            freq (str, optional): frequency of the periods, see aggregate. Defaults to "M".
+            stat (str, optional): statistic of the days in a period, see aggregate. Defaults to "sum".
+
+        Returns:
+            Dict[str, np.ndarray]: grid of each slot (MMDD, MM, Y or the season)
+        """
+        nodata = self.__imd._meta()["nodata"]
+        return _agg.climatology(_agg.aggregate(self.iter_arrays(), freq, stat, nodata), nodata)
+
+    def anomaly(
+        self, freq: str = "M", stat: str = "sum", climatology: Optional[Dict[str, np.ndarray]] = None
+    ) -> Iterator[Tuple[str, np.ndarray]]:
+        """difference of the periods from their climatology
+
+        Args:
+            freq (str, optional): frequency of the periods, see aggregate. Defaults to "M".
+            stat (str, optional): statistic of the days in a period, see aggregate. Defaults to "sum".
+            climatology (Optional[Dict[str, np.ndarray]]): climatology of the same freq and stat,
+                like from a longer base period, defaults to the climatology of this data.
+
+        Yields:
+            Iterator[Tuple[str, np.ndarray]]: label and anomaly grid of each period
+        """
+        nodata = self.__imd._meta()["nodata"]
+        clim = climatology if climatology is not None else self.climatology(freq, stat)
+        periods = _agg.aggregate(self.iter_arrays(), freq, stat, nodata)
+        return _agg.anomaly(periods, clim, nodata)
+
+    def save_geotiff(
+        self, items: Iterable[Tuple[str, np.ndarray]], path: str, suffix: str = "", **options
+    ) -> List[str]:
+        """write labelled grids, like the output of aggregate or climatology,
+        as GeoTIFF files named after the parameter and the label
+
+        Args:
+            items (Iterable[Tuple[str, np.ndarray]]): label and north up grid, or a dict
+            path (str): directory path to save the files
+            suffix (str, optional): added to the label in the file name, like '_sum'. Defaults to "".
+            **options: dtype, compress, predictor, blocksize and cog as in to_geotiff
+
+        Returns:
+            List[str]: paths of the written files
+        """
+        self.__imd._checked_path(path)
+        items = items.items() if isinstance(items, dict) else items
+        cog = options.pop("cog", False)
+        profile = self.__imd._output_profile(1, **options)
+        files = []
+        for label, arr in items:
+            _, out_file = self.__imd._get_labelpath(f"{label}{suffix}", path, "tif")
+            with self.__imd._open_tif(out_file, profile, cog) as dst:
+                dst.write(arr, 1)
+            files.append(out_file)
+        return files
 
     def __len__(self) -> int:
         return self.total_days - len(self.skipped_downloads)
@@ -115,3 +709,111 @@ class get_data:
     @property
     def px_size(self) -> str:
         return f"{self.__imd._px_size} degree(s)"
+
+    @property
+    def nodata(self) -> float:
+        return self.__imd._meta()["nodata"]
+
+
+class get_batch:
+    """Downloads several parameters for the same dates upon initialization with
+    a single shared thread pool and connection pool, and converts them through
+    the same thread pool. The pool and the connections are released by close,
+    or on exit when used as a context manager:
+
+        with get_batch(['rain', 'tmax'], '2020-01-01', '2020-12-31', path) as batch:
+            batch.to_geotiff(tif_path)
+
+    Args:
+        parameters (Sequence[str]): any of 'raingpm','tmax','tmin','rain','tmaxone','tminone'
+        start_date (str): start date to get data
+        end_date (str): end date for data
+        path (str): directory path to save the downloaded data
+        quiet (bool, optional): when True does not display Progress Bar. Defaults to False.
+        pool_size (int, optional): number of threads and pooled connections shared by all
+            parameters. Defaults to 10.
+        retries (int, optional): retries for connection errors and 5xx responses. Defaults to 3.
+        backoff (float, optional): exponential backoff factor in seconds between retries. Defaults to 0.5.
+        **kwargs: other arguments of get_data applied to every parameter
+
+    Raises:
+        ValueError: provided parameter is not recognized
+    """
+
+    def __init__(
+        self,
+        parameters: Sequence[str],
+        start_date: str,
+        end_date: str,
+        path: str,
+        quiet: bool = False,
+        pool_size: int = 10,
+        retries: int = 3,
+        backoff: float = 0.5,
+        **kwargs: Any,
+    ) -> None:
+        unknown = [p for p in parameters if p not in _IMDPARAMS]
+        if unknown:
+            raise ValueError(f"{unknown} is not available in IMD. {_IMDPARAMS}")
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.parameters = list(dict.fromkeys(parameters))
+        self.executor = ThreadPoolExecutor(pool_size)
+        self.session = _new_session(pool_size, retries, backoff)
+        self.data: Dict[str, get_data] = {}
+        self.errors: Dict[str, Exception] = {}
+        # the parameters are orchestrated on their own threads, the downloads
+        # of all of them run on the shared executor
+        self.__each(
+            lambda p: get_data(
+                p, start_date, end_date, path, quiet, pool_size,
+                session=self.session, executor=self.executor, **kwargs,
+            ),
+            self.parameters, collect=True,
+        )
+
+    def __each(self, func: Callable[[str], Any], params: List[str], collect: bool = False) -> None:
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        with ThreadPoolExecutor(max(len(params), 1)) as ex:
+            futures = {ex.submit(func, p): p for p in params}
+            for f in as_completed(futures):
+                param = futures[f]
+                try:
+                    result = f.result()
+                except (ValueError, OSError) as e:
+                    self.errors[param] = e
+                    continue
+                if collect:
+                    self.data[param] = result
+
+    @property
+    def skipped_downloads(self) -> Dict[str, List[str]]:
+        """dates for which download failed for each parameter"""
+        return {p: d.skipped_downloads for p, d in self.data.items()}
+
+    def to_geotiff(self, path: str, **kwargs: Any) -> None:
+        """conversion of downloaded grd data of all the parameters to geotiff format.
+
+        Args:
+            path (str): directory path to save the converted files
+            **kwargs: arguments of get_data.to_geotiff
+        """
+        self.__each(lambda p: self.data[p].to_geotiff(path, **kwargs), list(self.data))
+
+    def __getitem__(self, param: str) -> get_data:
+        return self.data[param]
+
+    def close(self) -> None:
+        """shut down the shared thread pool and close the connections, the
+        data of each parameter stays usable with its own thread pool and session"""
+        for data in self.data.values():
+            data._detach()
+        self.executor.shutdown()
+        self.session.close()
+
+    def __enter__(self) -> "get_batch":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -0,0 +1,286 @@
+"""Agro-climatic indices of the daily grids: growing degree days, spells of days
+above or below a threshold (heatwaves, consecutive dry days, wet spells) and
+percentiles of the record for percentile based extremes.
+
+The days of each period are stacked in chunks along time and every index is
+computed with array operations over the chunk, run lengths are carried from one
+chunk to the next so memory is bounded by the chunk and not the record. Pixels
+with the no data value of the parameter are left out, spells are broken by
+them, and a pixel without any valid day in a period is no data in the result.
+
+    from imddaily import indices
+    for year, grid in indices.heatwaves(tmax, threshold=40.0, min_length=3):
+        ...
+
+Raises:
+    ValueError: statistic is not recognized or the date ranges differ
+"""
+from itertools import groupby, islice
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Sequence, Tuple, Union
+import numpy as np
+from .aggregate import period
+
+if TYPE_CHECKING:
+    from datetime import datetime
+    from .imddaily import get_data
+
+SPELL_STATS = ("longest", "count", "days")
+
+
+class RunLength:
+    """running length of the runs of consecutive days meeting a condition,
+    carried across time chunks
+
+    Args:
+        shape (Tuple[int, ...]): shape of the grids
+        min_length (int, optional): minimum length of a run counted as a spell. Defaults to 1.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], min_length: int = 1) -> None:
+        self.min_length = min_length
+        self.current = np.zeros(shape, "int32")
+        self.longest = np.zeros(shape, "int32")
+        self.count = np.zeros(shape, "int32")
+        self.days = np.zeros(shape, "int32")
+
+    def update(self, cond: np.ndarray) -> None:
+        """extend the runs with a chunk of days
+
+        The length of the run ending on each day is the distance to the last
+        day not meeting the condition, found with a running maximum along time,
+        or the run carried from the previous chunk if there is no such day.
+        A spell is counted on the day its run reaches min_length.
+
+        Args:
+            cond (np.ndarray): (days, ...) boolean condition of each day
+        """
+        idx = np.arange(len(cond), dtype="int32").reshape(-1, *([1] * (cond.ndim - 1)))
+        reset = np.maximum.accumulate(np.where(cond, np.int32(-1), idx), axis=0)
+        length = np.where(cond, np.where(reset < 0, idx + 1 + self.current, idx - reset), 0)
+        np.maximum(self.longest, length.max(axis=0), out=self.longest)
+        reached = (length == self.min_length).sum(axis=0, dtype="int32")
+        self.count += reached
+        self.days += reached * self.min_length + (length > self.min_length).sum(axis=0, dtype="int32")
+        self.current = length[-1].astype("int32")
+
+
+def _chunks(
+    items: Iterable[Tuple["datetime", np.ndarray]], freq: str, chunk: int
+) -> Iterator[Tuple[str, Iterator[np.ndarray]]]:
+    """group the days into periods and stack the days of a period in chunks
+
+    Yields:
+        Iterator[Tuple[str, Iterator[np.ndarray]]]: label of the period and its
+        (days, lat, lon) chunks, to be consumed before the next period
+    """
+    key = period(freq)
+    keyed = ((key(date), arr) for date, arr in items)
+    for label, group in groupby(keyed, key=lambda x: x[0] and x[0][0]):
+        if label is None:
+            continue
+        arrays = (arr for _, arr in group)
+        yield (label, (np.stack(b) for b in iter(lambda: list(islice(arrays, chunk)), [])))
+
+
+def _nodata(data: "get_data") -> np.float32:
+    return np.float32(data.nodata)
+
+
+def growing_degree_days(
+    tmax: "get_data",
+    tmin: "get_data",
+    base: float = 10.0,
+    upper: Optional[float] = None,
+    freq: str = "Y",
+    chunk: int = 64,
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """sum of the daily mean temperature above the base temperature, the mean
+    of tmax and tmin capped at upper
+
+    Args:
+        tmax (get_data): maximum temperature of the same dates and grid as tmin
+        tmin (get_data): minimum temperature
+        base (float, optional): base temperature in degree C. Defaults to 10.0.
+        upper (Optional[float]): cap of the mean temperature, defaults to None.
+        freq (str, optional): periods of the index, see aggregate.period. Defaults to "Y".
+        chunk (int, optional): days stacked at once. Defaults to 64.
+
+    Raises:
+        ValueError: date ranges of tmax and tmin differ
+
+    Yields:
+        Iterator[Tuple[str, np.ndarray]]: label and float32 grid of each period
+    """
+    if (tmax.start_date, tmax.end_date) != (tmin.start_date, tmin.end_date):
+        raise ValueError("tmax and tmin must cover the same dates")
+    nodata = _nodata(tmax)
+    nodata_min = _nodata(tmin)
+
+    def tmean() -> Iterator[Tuple["datetime", np.ndarray]]:
+        for (date, tx), (_, tn) in zip(tmax.iter_arrays(), tmin.iter_arrays()):
+            valid = (tx != nodata) & (tn != nodata_min)
+            yield (date, np.where(valid, (tx + tn) / 2, nodata).astype("float32"))
+
+    for label, chunks in _chunks(tmean(), freq, chunk):
+        total, valid_days = None, None
+        for block in chunks:
+            valid = block != nodata
+            mean = np.minimum(block, upper) if upper is not None else block
+            degrees = np.where(valid, np.maximum(mean - base, 0), 0).sum(axis=0, dtype="float64")
+            total = degrees if total is None else total + degrees
+            days = valid.sum(axis=0)
+            valid_days = days if valid_days is None else valid_days + days
+        yield (label, np.where(valid_days > 0, total, nodata).astype("float32"))
+
+
+def spells(
+    data: "get_data",
+    threshold: Union[float, np.ndarray],
+    above: bool = True,
+    min_length: int = 1,
+    stat: str = "longest",
+    freq: str = "Y",
+    chunk: int = 64,
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """runs of consecutive days at or above (or below) a threshold in each
+    period, runs are not carried over from one period to the next
+
+    Args:
+        data (get_data): daily data
+        threshold (Union[float, np.ndarray]): value or north up grid, like the output of percentile
+        above (bool, optional): days >= threshold if True, days < threshold if False. Defaults to True.
+        min_length (int, optional): minimum days of a spell. Defaults to 1.
+        stat (str, optional): 'longest' run, 'count' of spells or 'days' in spells. Defaults to "longest".
+        freq (str, optional): periods of the index, see aggregate.period. Defaults to "Y".
+        chunk (int, optional): days stacked at once. Defaults to 64.
+
+    Raises:
+        ValueError: statistic is not recognized
+
+    Yields:
+        Iterator[Tuple[str, np.ndarray]]: label and float32 grid of each period
+    """
+    if stat not in SPELL_STATS:
+        raise ValueError(f"{stat} statistic is not available. {SPELL_STATS}")
+    nodata = _nodata(data)
+    for label, chunks in _chunks(data.iter_arrays(), freq, chunk):
+        runs, valid_days = None, None
+        for block in chunks:
+            valid = block != nodata
+            cond = valid & ((block >= threshold) if above else (block < threshold))
+            if runs is None:
+                runs, valid_days = RunLength(block.shape[1:], min_length), 0
+            runs.update(cond)
+            valid_days = valid_days + valid.sum(axis=0)
+        yield (label, np.where(valid_days > 0, getattr(runs, stat), nodata).astype("float32"))
+
+
+def heatwaves(
+    tmax: "get_data",
+    threshold: Union[float, np.ndarray] = 40.0,
+    min_length: int = 3,
+    stat: str = "count",
+    freq: str = "Y",
+    chunk: int = 64,
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """spells of at least min_length days with tmax at or above the threshold
+
+    Args:
+        tmax (get_data): maximum temperature
+        threshold (Union[float, np.ndarray], optional): degree C or a grid like the 90th
+            percentile of tmax. Defaults to 40.0.
+        min_length (int, optional): minimum days of a heatwave. Defaults to 3.
+        stat (str, optional): 'count', 'days' or 'longest', see spells. Defaults to "count".
+        freq (str, optional): periods of the index. Defaults to "Y".
+        chunk (int, optional): days stacked at once. Defaults to 64.
+
+    Yields:
+        Iterator[Tuple[str, np.ndarray]]: label and float32 grid of each period
+    """
+    return spells(tmax, threshold, True, min_length, stat, freq, chunk)
+
+
+def consecutive_dry_days(
+    rain: "get_data", threshold: float = 1.0, freq: str = "Y", chunk: int = 64
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """longest run of days with rainfall below the threshold (CDD)
+
+    Args:
+        rain (get_data): rainfall
+        threshold (float, optional): rainfall of a wet day in mm. Defaults to 1.0.
+        freq (str, optional): periods of the index. Defaults to "Y".
+        chunk (int, optional): days stacked at once. Defaults to 64.
+
+    Yields:
+        Iterator[Tuple[str, np.ndarray]]: label and float32 grid of each period
+    """
+    return spells(rain, threshold, False, 1, "longest", freq, chunk)
+
+
+def wet_spells(
+    rain: "get_data",
+    threshold: float = 1.0,
+    min_length: int = 3,
+    stat: str = "count",
+    freq: str = "Y",
+    chunk: int = 64,
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """spells of at least min_length days with rainfall at or above the threshold
+
+    Args:
+        rain (get_data): rainfall
+        threshold (float, optional): rainfall of a wet day in mm. Defaults to 1.0.
+        min_length (int, optional): minimum days of a wet spell. Defaults to 3.
+        stat (str, optional): 'count', 'days' or 'longest', see spells. Defaults to "count".
+        freq (str, optional): periods of the index. Defaults to "Y".
+        chunk (int, optional): days stacked at once. Defaults to 64.
+
+    Yields:
+        Iterator[Tuple[str, np.ndarray]]: label and float32 grid of each period
+    """
+    return spells(rain, threshold, True, min_length, stat, freq, chunk)
+
+
+def percentile(
+    data: "get_data",
+    q: Union[float, Sequence[float]],
+    min_value: Optional[float] = None,
+    rows: int = 16,
+) -> np.ndarray:
+    """percentiles of each pixel over all the days, like the 95th percentile of
+    the wet days for R95p or the 90th percentile of tmax as a heatwave
+    threshold. The grid is processed in blocks of rows so that only a block of
+    every day is in memory.
+
+    Args:
+        data (get_data): daily data
+        q (Union[float, Sequence[float]]): percentile or percentiles between 0 and 100
+        min_value (Optional[float]): only days at or above this value, like 1 mm for wet days,
+            defaults to None.
+        rows (int, optional): rows of the grid in a block. Defaults to 16.
+
+    Returns:
+        np.ndarray: float32 (lat, lon) grid, or (len(q), lat, lon) for several percentiles,
+        no data value where a pixel has no valid days
+    """
+    nodata = _nodata(data)
+    height, width = next(data.iter_arrays())[1].shape
+    qs = np.atleast_1d(np.asarray(q, "float64")) / 100
+    out = np.empty((len(qs), height, width), "float32")
+    for start in range(0, height, rows):
+        stack = np.stack([arr[start : start + rows] for _, arr in data.iter_arrays()])
+        valid = stack != nodata
+        if min_value is not None:
+            valid &= stack >= min_value
+        # invalid values sort last, the percentile interpolates linearly between
+        # the two valid values around its rank like numpy's default method
+        stack = np.sort(np.where(valid, stack, np.inf), axis=0)
+        n = valid.sum(axis=0)
+        pos = qs[:, None, None] * np.maximum(n - 1, 0)
+        lo = np.floor(pos).astype("int64")
+        hi = np.minimum(lo + 1, np.maximum(n - 1, 0))
+        low = np.take_along_axis(stack, lo, axis=0)
+        high = np.take_along_axis(stack, hi, axis=0)
+        result = low + (high - low) * (pos - lo)
+        out[:, start : start + rows] = np.where(n > 0, result, nodata)
+    return out if np.ndim(q) else out[0]
@@ -0,0 +1,242 @@
+"""Instrumentation of the imddaily package. The download and conversion stages
+report an event per day to a metrics sink:
+
+    fetch: HTTP request and transfer of the grd file, with the status code,
+        bytes received, retries and the reason of a failure, or the reuse of
+        a day of the shared cache or the archive marked as cached, without a
+        request
+    write: writing the downloaded grd file to disk
+    read: reading the window of the grd file into memory
+    transform: flipping the grid north up and casting to the output data type
+    geotiff: writing the day to the GeoTIFF file
+
+The default sink does nothing and does not time the stages. Sinks are passed to
+get_data with the metrics argument, tqdm progress is one of the sinks.
+"""
+import json, threading, time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+STAGES = ("fetch", "write", "read", "transform", "geotiff")
+
+
+class Event(NamedTuple):
+    """timing of a stage for a day
+
+    Args:
+        stage (str): one of STAGES
+        date (Optional[datetime]): date of the day
+        seconds (float): wall time of the stage
+        nbytes (int): bytes transferred, written or read
+        retries (int): retries of the request
+        status (Optional[int]): http status code of the response
+        error (Optional[str]): reason of a failure, None if the stage succeeded
+        cached (bool): the day was served from the shared cache or the archive without a request
+    """
+
+    stage: str
+    date: Optional[datetime]
+    seconds: float
+    nbytes: int = 0
+    retries: int = 0
+    status: Optional[int] = None
+    error: Optional[str] = None
+    cached: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = self._asdict()
+        d["date"] = f"{self.date:%Y-%m-%d}" if self.date else None
+        return d
+
+
+class _NullTimer:
+    """timer of the disabled sinks, fields set on it are ignored"""
+
+    nbytes = retries = 0
+    status = error = None
+    cached = False
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+    def exclude(self, seconds: float) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    """times a stage and emits its event on exit, the fields of the event are
+    set on the timer inside the block"""
+
+    __slots__ = ("sink", "stage", "date", "start", "nbytes", "retries", "status", "error", "cached")
+
+    def __init__(self, sink: "Metrics", stage: str, date: Optional[datetime]) -> None:
+        self.sink, self.stage, self.date = sink, stage, date
+        self.nbytes = self.retries = 0
+        self.status = self.error = None
+        self.cached = False
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        if exc_type is not None and self.error is None:
+            self.error = exc_type.__name__
+        self.sink.emit(Event(
+            self.stage, self.date, time.perf_counter() - self.start,
+            self.nbytes, self.retries, self.status, self.error, self.cached,
+        ))
+
+    def exclude(self, seconds: float) -> None:
+        """leave out time spent in a nested stage which is reported separately"""
+        self.start += seconds
+
+
+class Metrics:
+    """base of the metrics sinks and the default sink, which does nothing.
+    Subclasses set enabled and override emit, which is called from the
+    download and conversion threads.
+    """
+
+    enabled = False
+
+    def emit(self, event: Event) -> None:
+        """receive the event of a stage
+
+        Args:
+            event (Event): timing of the stage
+        """
+
+    def timer(self, stage: str, date: Optional[datetime] = None) -> Any:
+        """context manager timing a stage and emitting its event
+
+        Args:
+            stage (str): one of STAGES
+            date (Optional[datetime]): date of the day, defaults to None.
+
+        Returns:
+            Any: timer on which nbytes, retries, status and error can be set
+        """
+        return _Timer(self, stage, date) if self.enabled else _NULL_TIMER
+
+    def close(self) -> None:
+        pass
+
+
+NOOP = Metrics()
+
+
+class Callback(Metrics):
+    """sink calling a function with each event
+
+    Args:
+        func (Callable[[Event], None]): called with each event
+    """
+
+    enabled = True
+
+    def __init__(self, func: Callable[[Event], None]) -> None:
+        self.func = func
+
+    def emit(self, event: Event) -> None:
+        self.func(event)
+
+
+class Recorder(Metrics):
+    """sink keeping the events in memory for a summary or export"""
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self.events: List[Event] = []
+        self.__lock = threading.Lock()
+
+    def emit(self, event: Event) -> None:
+        with self.__lock:
+            self.events.append(event)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """totals of each stage
+
+        Returns:
+            Dict[str, Dict[str, Any]]: count, total, mean and max seconds,
+            bytes, retries, days served from the cache and count of each
+            failure reason per stage
+        """
+        out = {}
+        for stage in STAGES:
+            events = [e for e in self.events if e.stage == stage]
+            if not events:
+                continue
+            seconds = [e.seconds for e in events]
+            out[stage] = {
+                "count": len(events),
+                "seconds": sum(seconds),
+                "mean_seconds": sum(seconds) / len(events),
+                "max_seconds": max(seconds),
+                "bytes": sum(e.nbytes for e in events),
+                "retries": sum(e.retries for e in events),
+                "cached": sum(e.cached for e in events),
+                "errors": dict(Counter(e.error for e in events if e.error)),
+            }
+        return out
+
+    def to_jsonl(self, path: str) -> None:
+        """write the events as JSON lines
+
+        Args:
+            path (str): output file path
+        """
+        with open(path, "w") as f:
+            for e in self.events:
+                f.write(json.dumps(e.to_dict()) + "\n")
+
+
+class Progress(Metrics):
+    """tqdm progress bar advanced by the events of a stage
+
+    Args:
+        stage (str): stage counted by the bar
+        total (int): number of events expected
+        disable (bool, optional): do not display the bar. Defaults to False.
+    """
+
+    def __init__(self, stage: str, total: int, disable: bool = False) -> None:
+        self.stage = stage
+        self.enabled = not disable
+        self.bar = None
+        if not disable:
+            from tqdm import tqdm
+
+            self.bar = tqdm(total=total)
+
+    def emit(self, event: Event) -> None:
+        if event.stage == self.stage:
+            self.bar.update(1)
+
+    def close(self) -> None:
+        if self.bar is not None:
+            self.bar.close()
+
+
+class Tee(Metrics):
+    """sink passing the events to the enabled sinks among several
+
+    Args:
+        sinks (Sequence[Optional[Metrics]]): sinks, None entries are left out
+    """
+
+    def __init__(self, *sinks: Optional[Metrics]) -> None:
+        self.sinks: Sequence[Metrics] = [s for s in sinks if s is not None and s.enabled]
+        self.enabled = bool(self.sinks)
+
+    def emit(self, event: Event) -> None:
+        for s in self.sinks:
+            s.emit(event)
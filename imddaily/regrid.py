@@ -0,0 +1,194 @@
+"""Regridding of the daily grids onto the grid of another parameter or a user
+grid with nearest, bilinear or conservative weights. The weights of a pair of
+grids form a sparse target x source matrix which is computed once and cached
+on disk, a batch of days is then regridded with one sparse product.
+
+The IMD grids are regular in latitude and longitude, so the weights are the
+product of the weights along the rows and along the columns. Conservative
+weights are the overlapping areas of the cells on the sphere.
+
+Raises:
+    ValueError: method is not recognized
+"""
+import hashlib, json, os
+from typing import Optional, Tuple
+import numpy as np
+from .fileio import atomic_write
+
+METHODS = ("nearest", "bilinear", "conservative")
+
+
+def coords(param: str) -> Tuple[np.ndarray, np.ndarray]:
+    """coordinates of the pixel centres of the full grid of a parameter
+
+    Args:
+        param (str): one of 'raingpm','tmax','tmin','rain','tmaxone','tminone'
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: latitudes (north to south) and longitudes (west to east)
+    """
+    from .core import IMD
+
+    return IMD(param)._coords()
+
+
+def _edges(centres: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """lower and upper edges of the cells of ascending centres"""
+    mid = (centres[1:] + centres[:-1]) / 2
+    first = centres[0] - (mid[0] - centres[0]) if len(mid) else centres[0] - 0.5
+    last = centres[-1] + (centres[-1] - mid[-1]) if len(mid) else centres[-1] + 0.5
+    return (np.concatenate([[first], mid]), np.concatenate([mid, [last]]))
+
+
+def _axis(method: str, src: np.ndarray, dst: np.ndarray, lat: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """weights along one axis as coordinate arrays of target index, source
+    index and weight, for centres in any monotonic order
+
+    Args:
+        method (str): one of METHODS
+        src (np.ndarray): centres of the source cells
+        dst (np.ndarray): centres of the target cells
+        lat (bool): the axis is latitude, conservative overlaps are measured in sin(lat)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: target index, source index and weight
+    """
+    order = np.argsort(src)
+    s = src[order]
+    lo, hi = _edges(s)
+    targets = np.arange(len(dst))
+    if method == "nearest":
+        pos = np.clip(np.searchsorted(s, dst), 1, len(s) - 1)
+        pos -= dst - s[pos - 1] < s[pos] - dst
+        inside = (dst >= lo[0]) & (dst <= hi[-1])
+        return (targets[inside], order[pos[inside]], np.ones(inside.sum()))
+    if method == "bilinear":
+        pos = np.clip(np.searchsorted(s, dst, "right") - 1, 0, len(s) - 2)
+        t = (dst - s[pos]) / (s[pos + 1] - s[pos])
+        inside = (dst >= s[0]) & (dst <= s[-1])
+        tgt, p, t = targets[inside], pos[inside], t[inside]
+        return (
+            np.concatenate([tgt, tgt]),
+            np.concatenate([order[p], order[p + 1]]),
+            np.concatenate([1 - t, t]),
+        )
+    d_order = np.argsort(dst)
+    d_lo, d_hi = _edges(dst[d_order])
+    d_lo, d_hi = d_lo[np.argsort(d_order)], d_hi[np.argsort(d_order)]
+    if lat:
+        lo, hi, d_lo, d_hi = (np.sin(np.radians(np.clip(e, -90, 90))) for e in (lo, hi, d_lo, d_hi))
+    overlap = np.minimum(d_hi[:, None], hi[None]) - np.maximum(d_lo[:, None], lo[None])
+    tgt, src_idx = np.nonzero(overlap > 0)
+    return (tgt, order[src_idx], overlap[tgt, src_idx])
+
+
+class Weights:
+    """sparse target x source matrix of regridding weights between two grids,
+    stored as coordinate arrays sorted by target
+
+    Args:
+        target (np.ndarray): flat index of the target pixel
+        source (np.ndarray): flat index of the source pixel
+        weight (np.ndarray): weight of the source pixel
+        shape (Tuple[int, int]): rows and columns of the target grid
+    """
+
+    def __init__(self, target: np.ndarray, source: np.ndarray, weight: np.ndarray, shape: Tuple[int, int]) -> None:
+        self.target = target
+        self.source = source
+        self.weight = weight
+        self.shape = shape
+        counts = np.bincount(target, minlength=shape[0] * shape[1])
+        # targets with weights and the start of their entries for the reductions
+        self.__filled = np.flatnonzero(counts)
+        self.__starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[self.__filled]
+
+    @classmethod
+    def build(
+        cls, method: str, src_lats: np.ndarray, src_lons: np.ndarray, dst_lats: np.ndarray, dst_lons: np.ndarray
+    ) -> "Weights":
+        """weights from the source to the target grid
+
+        Args:
+            method (str): 'nearest', 'bilinear' or 'conservative'
+            src_lats (np.ndarray): latitudes of the source rows
+            src_lons (np.ndarray): longitudes of the source columns
+            dst_lats (np.ndarray): latitudes of the target rows
+            dst_lons (np.ndarray): longitudes of the target columns
+
+        Raises:
+            ValueError: method is not recognized
+
+        Returns:
+            Weights: weights with flat indices of north up (row, column) grids
+        """
+        if method not in METHODS:
+            raise ValueError(f"{method} method is not available. {METHODS}")
+        r, sr, wr = _axis(method, np.asarray(src_lats, "float64"), np.asarray(dst_lats, "float64"), True)
+        c, sc, wc = _axis(method, np.asarray(src_lons, "float64"), np.asarray(dst_lons, "float64"), False)
+        target = (r[:, None] * len(dst_lons) + c[None]).ravel()
+        source = (sr[:, None] * len(src_lons) + sc[None]).ravel()
+        weight = (wr[:, None] * wc[None]).ravel()
+        keep = weight > 0
+        order = np.argsort(target[keep], kind="stable")
+        return cls(
+            target[keep][order].astype("int64"), source[keep][order].astype("int64"),
+            weight[keep][order], (len(dst_lats), len(dst_lons)),
+        )
+
+    @classmethod
+    def cached(
+        cls, method: str, src_lats: np.ndarray, src_lons: np.ndarray, dst_lats: np.ndarray, dst_lons: np.ndarray,
+        cache_dir: Optional[str] = None,
+    ) -> "Weights":
+        """load the weights from the cache directory or build and save them,
+        the cache key covers the method and both grids
+
+        Args:
+            method (str): 'nearest', 'bilinear' or 'conservative'
+            src_lats (np.ndarray): latitudes of the source rows
+            src_lons (np.ndarray): longitudes of the source columns
+            dst_lats (np.ndarray): latitudes of the target rows
+            dst_lons (np.ndarray): longitudes of the target columns
+            cache_dir (Optional[str]): directory of the cached weights, not cached if None.
+
+        Returns:
+            Weights: weights from the source to the target grid
+        """
+        if not cache_dir:
+            return cls.build(method, src_lats, src_lons, dst_lats, dst_lons)
+        grids = [np.round(np.asarray(a, "float64"), 6).tolist() for a in (src_lats, src_lons, dst_lats, dst_lons)]
+        key = hashlib.sha1(json.dumps([method, grids]).encode()).hexdigest()
+        cache_file = os.path.join(cache_dir, f"regrid_{key}.npz")
+        if os.path.isfile(cache_file):
+            with np.load(cache_file) as f:
+                return cls(f["target"], f["source"], f["weight"], tuple(f["shape"]))
+        w = cls.build(method, src_lats, src_lons, dst_lats, dst_lons)
+        with atomic_write(cache_file) as f:
+            np.savez(f, target=w.target, source=w.source, weight=w.weight, shape=w.shape)
+        return w
+
+    def apply(self, stack: np.ndarray, nodata: float) -> np.ndarray:
+        """regrid a batch of days, the weights of no data pixels are left out
+        and the remaining weights of a target pixel renormalized
+
+        Args:
+            stack (np.ndarray): (days, lat, lon) or (lat, lon) north up source grids
+            nodata (float): no data value of the source and the result
+
+        Returns:
+            np.ndarray: float32 grids on the target grid, no data value where a
+            target pixel has no valid source pixels
+        """
+        nodata = np.float32(nodata)
+        single = stack.ndim == 2
+        flat = stack.reshape(1 if single else len(stack), -1)
+        out = np.full((len(flat), self.shape[0] * self.shape[1]), nodata, "float32")
+        if len(self.__filled):
+            values = flat[:, self.source]
+            valid = values != nodata
+            total = np.add.reduceat(np.where(valid, values * self.weight, 0), self.__starts, axis=1)
+            covered = np.add.reduceat(np.where(valid, self.weight, 0), self.__starts, axis=1)
+            out[:, self.__filled] = np.where(covered > 0, total / np.where(covered > 0, covered, 1), nodata)
+        out = out.reshape(len(flat), *self.shape)
+        return out[0] if single else out
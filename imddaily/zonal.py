@@ -0,0 +1,156 @@
+"""Zonal statistics of the daily grids over polygons. The fraction of each pixel
+covered by each polygon is computed once per parameter grid as a sparse weight
+matrix and cached on disk, the statistics of a day are then a sparse matrix
+vector product over the memory mapped grd file.
+
+Raises:
+    ValueError: statistic is not recognized
+"""
+import hashlib, json, math, os
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+import numpy as np
+from affine import Affine
+from rasterio.features import bounds, rasterize
+from .fileio import atomic_write
+
+STATS = ("mean", "weighted_mean", "sum", "min", "max")
+
+
+class PixelWeights:
+    """sparse zone x pixel matrix of the fraction of each pixel covered by each
+    zone, stored as coordinate arrays sorted by zone
+
+    Args:
+        zone (np.ndarray): zone index of the entries
+        pixel (np.ndarray): flat index of the pixel in the grd file
+        weight (np.ndarray): covered fraction of the pixel
+        n_zones (int): number of zones
+    """
+
+    def __init__(self, zone: np.ndarray, pixel: np.ndarray, weight: np.ndarray, n_zones: int) -> None:
+        self.zone = zone
+        self.pixel = pixel
+        self.weight = weight
+        self.n_zones = n_zones
+        # start of each zone in the entries for the min and max reductions
+        self.__starts = np.searchsorted(zone, np.arange(n_zones))
+        self.__empty = np.bincount(zone, minlength=n_zones) == 0
+
+    @classmethod
+    def build(cls, geometries: Sequence[Any], transform: Affine, shape: Tuple[int, int], supersample: int = 10) -> "PixelWeights":
+        """rasterize each geometry on a supersampled window of the grid around
+        its bounds to get the covered fraction of the pixels
+
+        Args:
+            geometries (Sequence[Any]): GeoJSON like geometries in EPSG:4326
+            transform (Affine): transform of the north up grid
+            shape (Tuple[int, int]): rows and columns of the grid
+            supersample (int, optional): subdivisions of a pixel along each axis. Defaults to 10.
+
+        Returns:
+            PixelWeights: weights with flat indices in the stored (south to north) grd order
+        """
+        rows, cols = shape
+        inv = ~transform
+        zones, pixels, weights = [], [], []
+        for z, geom in enumerate(geometries):
+            minx, miny, maxx, maxy = bounds(geom)
+            x0, y0 = inv * (minx, maxy)
+            x1, y1 = inv * (maxx, miny)
+            c0, r0 = max(math.floor(x0), 0), max(math.floor(y0), 0)
+            c1, r1 = min(math.ceil(x1), cols), min(math.ceil(y1), rows)
+            if c1 <= c0 or r1 <= r0:
+                continue
+            window = transform * Affine.translation(c0, r0) * Affine.scale(1 / supersample)
+            h, w = r1 - r0, c1 - c0
+            fine = rasterize(
+                [(geom, 1)], out_shape=(h * supersample, w * supersample),
+                transform=window, fill=0, dtype="uint8",
+            )
+            frac = fine.reshape(h, supersample, w, supersample).mean(axis=(1, 3))
+            r, c = np.nonzero(frac)
+            zones.append(np.full(len(r), z, "int64"))
+            pixels.append(((rows - 1 - (r + r0)) * cols + (c + c0)).astype("int64"))
+            weights.append(frac[r, c].astype("float64"))
+        if not zones:
+            return cls(np.zeros(0, "int64"), np.zeros(0, "int64"), np.zeros(0), len(geometries))
+        return cls(np.concatenate(zones), np.concatenate(pixels), np.concatenate(weights), len(geometries))
+
+    @classmethod
+    def cached(
+        cls, geometries: Sequence[Any], transform: Affine, shape: Tuple[int, int],
+        cache_dir: Optional[str] = None, supersample: int = 10,
+    ) -> "PixelWeights":
+        """load the weights from the cache directory or build and save them,
+        the cache key covers the grid, the geometries and the supersampling
+
+        Args:
+            geometries (Sequence[Any]): GeoJSON like geometries in EPSG:4326
+            transform (Affine): transform of the north up grid
+            shape (Tuple[int, int]): rows and columns of the grid
+            cache_dir (Optional[str]): directory of the cached weights, not cached if None.
+            supersample (int, optional): subdivisions of a pixel along each axis. Defaults to 10.
+
+        Returns:
+            PixelWeights: weights of the geometries on the grid
+        """
+        geometries = [getattr(g, "__geo_interface__", g) for g in geometries]
+        if not cache_dir:
+            return cls.build(geometries, transform, shape, supersample)
+        key = hashlib.sha1(
+            json.dumps([tuple(transform), shape, supersample, geometries], sort_keys=True).encode()
+        ).hexdigest()
+        cache_file = os.path.join(cache_dir, f"zonal_{key}.npz")
+        if os.path.isfile(cache_file):
+            with np.load(cache_file) as f:
+                return cls(f["zone"], f["pixel"], f["weight"], int(f["n_zones"]))
+        pw = cls.build(geometries, transform, shape, supersample)
+        with atomic_write(cache_file) as f:
+            np.savez(f, zone=pw.zone, pixel=pw.pixel, weight=pw.weight, n_zones=pw.n_zones)
+        return pw
+
+    def stats(self, flat: Optional[np.ndarray], nodata: float, stats: Iterable[str]) -> Dict[str, np.ndarray]:
+        """statistics of the zones for a day, no data pixels are left out
+
+        mean: mean of the pixels overlapping the zone
+        weighted_mean: mean of the pixels weighted by the covered fraction
+        sum: sum of the pixels weighted by the covered fraction
+        min, max: minimum and maximum of the pixels overlapping the zone
+
+        Args:
+            flat (Optional[np.ndarray]): flat grd array of the day, None if unavailable
+            nodata (float): no data value of the parameter
+            stats (Iterable[str]): statistics to compute
+
+        Returns:
+            Dict[str, np.ndarray]: float32 value per zone for each statistic,
+            no data value where the zone has no valid pixels
+        """
+        nodata = np.float32(nodata)
+        if flat is None:
+            return {s: np.full(self.n_zones, nodata, "float32") for s in stats}
+        values = flat[self.pixel].astype("float64")
+        valid = values != nodata
+        count = np.bincount(self.zone, weights=valid, minlength=self.n_zones)
+        covered = np.bincount(self.zone, weights=self.weight * valid, minlength=self.n_zones)
+        out = {}
+        for s in stats:
+            if s == "mean":
+                total = np.bincount(self.zone, weights=np.where(valid, values, 0), minlength=self.n_zones)
+                res = total / np.where(count > 0, count, 1)
+            elif s in ("weighted_mean", "sum"):
+                total = np.bincount(
+                    self.zone, weights=np.where(valid, values * self.weight, 0), minlength=self.n_zones
+                )
+                res = total if s == "sum" else total / np.where(covered > 0, covered, 1)
+            elif s in ("min", "max"):
+                ufunc, fill = (np.minimum, np.inf) if s == "min" else (np.maximum, -np.inf)
+                res = np.full(self.n_zones, fill)
+                if len(values):
+                    res[~self.__empty] = ufunc.reduceat(
+                        np.where(valid, values, fill), self.__starts[~self.__empty]
+                    )
+            else:
+                raise ValueError(f"{s} statistic is not available. {STATS}")
+            out[s] = np.where(count > 0, res, nodata).astype("float32")
+        return out
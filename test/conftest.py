@@ -0,0 +1,10 @@
+import pytest
+from benchmarks.mockimd import MockIMD
+
+
+@pytest.fixture
+def imd_server():
+    # grids without no data cells, so every value of a day can be checked
+    server = MockIMD(land=False).start()
+    yield server
+    server.stop()
@@ -0,0 +1,39 @@
+from imddaily import imddaily
+import os, pytest
+import numpy as np
+import rasterio
+
+
+def test_aggregate_monthly(imd_server, tmp_path):
+    imd_server.missing.add("max1_02052020.grd")
+    data = imddaily.get_data(
+        "tmaxone", "2020-04-29", "2020-05-03", str(tmp_path), True, base_url=imd_server.url
+    )
+    cube, _, _ = data.to_array()
+    periods = dict(data.aggregate("M", "sum"))
+    assert list(periods) == ["202004", "202005"]
+    assert periods["202004"] == pytest.approx(cube[0] + cube[1])
+    assert periods["202005"] == pytest.approx(cube[2] + cube[4])
+    means = dict(data.aggregate("M", "mean"))
+    assert means["202005"] == pytest.approx((cube[2] + cube[4]) / 2)
+    std = dict(data.aggregate("Y", "std"))["2020"]
+    assert std == pytest.approx(np.std(cube[[0, 1, 2, 4]], axis=0, ddof=1), rel=1e-4)
+    files = data.save_geotiff(data.aggregate("M", "max"), str(tmp_path), "_max")
+    assert os.path.basename(files[1]) == "tmax1_202005_max.tif"
+    with rasterio.open(files[1]) as f:
+        assert (f.read(1) == np.maximum(cube[2], cube[4])).all()
+
+
+def test_season_climatology_anomaly(imd_server, tmp_path):
+    data = imddaily.get_data(
+        "tminone", "2019-12-30", "2020-01-02", str(tmp_path), True, base_url=imd_server.url
+    )
+    cube, _, _ = data.to_array()
+    assert [label for label, _ in data.aggregate("DJF")] == ["2020DJF"]
+    assert [label for label, _ in data.aggregate("JJAS")] == []
+    clim = data.climatology("D")
+    assert sorted(clim) == ["0101", "0102", "1230", "1231"]
+    anomalies = dict(data.anomaly("M", "mean"))
+    assert (anomalies["201912"] == 0).all()
+    with pytest.raises(ValueError, match="frequency is not available"):
+        list(data.aggregate("X"))
@@ -0,0 +1,48 @@
+from imddaily import cli
+import os
+
+
+def test_cli_sync_fetches_only_missing_days(imd_server, tmp_path, capsys):
+    grd, tif = str(tmp_path / "grd"), str(tmp_path / "tif")
+    args = [
+        "sync", "--params", "rain,tmax", "--since", "2020-06-01", "--until", "2020-06-04",
+        "--out", grd, "--base-url", imd_server.url, "--retries", "0", "--quiet",
+    ]
+    assert cli.main(args) == 0
+    assert sorted(os.listdir(grd)) == [
+        f"{p}_2020060{d}.grd" for p in ("rain", "tmax") for d in range(1, 5)
+    ]
+    os.remove(os.path.join(grd, "rain_20200602.grd"))
+    imd_server.missing.add("rain_ind0.25_20_06_05.grd")
+    imd_server.hits.clear()
+    assert cli.main(args[:6] + ["2020-06-05", "--tif", tif] + args[7:]) == 0
+    assert sorted(n for n in imd_server.hits if n.startswith("rain")) == [
+        "rain_ind0.25_20_06_02.grd", "rain_ind0.25_20_06_05.grd",
+    ]
+    assert len([n for n in imd_server.hits if not n.startswith("rain")]) == 1
+    assert sorted(os.listdir(tif)) == ["rain_20200602.tif", "tmax_20200605.tif"]
+    out = capsys.readouterr().out.splitlines()
+    assert out[-2:] == [
+        "rain: 1 day(s) downloaded, 1 unavailable, 0 failed",
+        "tmax: 1 day(s) downloaded, 0 unavailable, 0 failed",
+    ]
+
+
+def test_cli_unknown_param(tmp_path):
+    args = ["sync", "--params", "snow", "--since", "2020-06-01", "--out", str(tmp_path)]
+    assert cli.main(args) == 2
+
+
+def test_cli_sync_failures_and_catalog(imd_server, tmp_path):
+    args = [
+        "sync", "--params", "tmaxone", "--since", "2020-06-01", "--until", "2020-06-03",
+        "--out", str(tmp_path), "--base-url", imd_server.url, "--retries", "0", "--quiet", "--catalog",
+    ]
+    imd_server.flaky["max1_02062020.grd"] = 1
+    imd_server.missing.add("max1_03062020.grd")
+    # days failed after all retries are reported in the exit status
+    assert cli.main(args) == 1
+    imd_server.hits.clear()
+    assert cli.main(args) == 0
+    # the catalog knows the unpublished day, it is not requested again
+    assert sorted(imd_server.hits) == ["max1_02062020.grd"]
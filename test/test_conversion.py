@@ -1,6 +1,8 @@
 from imddaily import imddaily
+from imddaily.core import IMD
 import rasterio
-import os, pytest
+import os, pytest, threading, time
+import numpy as np
 from datetime import datetime
 from datetime import timedelta as td
 
@@ -128,3 +130,210 @@ def test_conversion_single_quiet(param):
         with rasterio.open(out_path, "r") as sf:
             sf_arr = sf.read(idx + 1)
         assert (ind_arr == sf_arr).all()
+
+
+def test_to_array(imd_server, tmp_path):
+    imd_server.missing.add("max1_03052020.grd")
+    data = imddaily.get_data(
+        "tmaxone", "2020-05-01", "2020-05-04", str(tmp_path), True,
+        base_url=imd_server.url,
+    )
+    cube, lats, lons = data.to_array()
+    assert cube.shape == (4, 31, 31) and cube.dtype == "float32"
+    assert lats[0] == 37.5 and lats[-1] == 7.5
+    assert lons[0] == 67.5 and lons[-1] == 97.5
+    expected = imd_server.grid("maxone", "max1_01052020.grd").reshape(31, 31)[::-1]
+    assert (cube[0] == expected).all()
+    assert (cube[2] == np.float32(99.9)).all()
+    dates = [dt for dt, _ in data.iter_arrays()]
+    assert dates == [datetime(2020, 5, d) for d in range(1, 5)]
+
+
+def test_conversion_offline(imd_server, tmp_path):
+    data = imddaily.get_data(
+        "tmax", "2020-05-01", "2020-05-03", str(tmp_path), True,
+        base_url=imd_server.url,
+    )
+    data.to_geotiff(str(tmp_path))
+    data.to_geotiff(str(tmp_path), True, workers=2, batch_size=1)
+    cube, _, _ = data.to_array()
+    with rasterio.open(os.path.join(tmp_path, "tmax_20200501_20200503.tif")) as sf:
+        assert sf.count == 3
+        for idx, dt in enumerate(["20200501", "20200502", "20200503"]):
+            with rasterio.open(os.path.join(tmp_path, f"tmax_{dt}.tif")) as ind:
+                assert (ind.read(1) == sf.read(idx + 1)).all()
+                assert (ind.read(1) == cube[idx]).all()
+
+
+def test_conversion_options(imd_server, tmp_path):
+    data = imddaily.get_data(
+        "raingpm", "2020-05-01", "2020-05-02", str(tmp_path), True,
+        base_url=imd_server.url,
+    )
+    data.to_geotiff(str(tmp_path), True, compress="deflate", predictor=3, blocksize=64)
+    with rasterio.open(os.path.join(tmp_path, "raingpm_20200501_20200502.tif")) as f:
+        assert f.dtypes == ("float32", "float32")
+        assert f.compression.value == "DEFLATE"
+        assert f.block_shapes[0] == (64, 64)
+        single = f.read()
+    data.to_geotiff(str(tmp_path), dtype="float64", cog=True, compress="lzw")
+    with rasterio.open(os.path.join(tmp_path, "raingpm_20200502.tif")) as f:
+        assert f.count == 1 and f.dtypes == ("float64",)
+        assert f.compression.value == "LZW"
+        assert f.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG"
+        assert (f.read(1) == single[1]).all()
+    # integer types round the values and keep the no data value exact
+    data.to_geotiff(str(tmp_path), dtype="int16")
+    with rasterio.open(os.path.join(tmp_path, "raingpm_20200502.tif")) as f:
+        assert f.dtypes == ("int16",) and f.nodata == -999
+        assert (f.read(1) == np.rint(single[1])).all()
+    tmax = imddaily.get_data("tmaxone", "2020-05-01", "2020-05-02", str(tmp_path), True, download=False)
+    with pytest.raises(ValueError, match="cannot hold the no data value 99.9"):
+        tmax.to_geotiff(str(tmp_path), dtype="int16")
+
+
+def test_conversion_bbox(imd_server, tmp_path):
+    data = imddaily.get_data(
+        "rain", "2020-05-01", "2020-05-02", str(tmp_path), True,
+        base_url=imd_server.url,
+    )
+    full, lats, lons = data.to_array()
+    bbox = (72.6, 18.9, 74.1, 20.0)
+    data.to_geotiff(str(tmp_path), bbox=bbox)
+    with rasterio.open(os.path.join(tmp_path, "rain_20200501.tif")) as f:
+        assert f.shape == (5, 7)
+        assert f.bounds == pytest.approx((72.375, 18.875, 74.125, 20.125))
+        rows = (lats > 18.8) & (lats < 20.1)
+        cols = (lons > 72.4) & (lons < 74.2)
+        assert (f.read(1) == full[0][rows][:, cols]).all()
+    subset = imddaily.get_data(
+        "rain", "2020-05-01", "2020-05-02", str(tmp_path), True,
+        base_url=imd_server.url, bbox=bbox,
+    )
+    cube, sub_lats, sub_lons = subset.to_array()
+    assert cube.shape == (2, 5, 7)
+    assert sub_lats[0] == 20.0 and sub_lons[0] == 72.5
+    with pytest.raises(ValueError, match="does not intersect"):
+        data.to_geotiff(str(tmp_path), bbox=(0, 0, 1, 1))
+
+
+def test_pipelined_backpressure(imd_server, tmp_path):
+    release = threading.Event()
+    job = threading.Thread(
+        target=imddaily.get_data,
+        args=("tmaxone", "2020-05-01", "2020-05-20", str(tmp_path), True),
+        kwargs={"base_url": imd_server.url, "pool_size": 2, "sink_workers": 1,
+                "sink": lambda date, grd: release.wait()},
+    )
+    job.start()
+    try:
+        time.sleep(0.5)
+        # one day in the sink, two queued, one waiting to be queued and two downloading
+        assert sum(imd_server.hits.values()) <= 6
+    finally:
+        release.set()
+        job.join()
+    assert sum(imd_server.hits.values()) == 20
+
+
+def test_conversion_pipelined(imd_server, tmp_path):
+    grd_path, tif_path = tmp_path / "grd", tmp_path / "tif"
+    grd_path.mkdir()
+    tif_path.mkdir()
+    imd_server.missing.add("min03052020.grd")
+    seen = []
+    data = imddaily.get_data(
+        "tmin", "2020-05-01", "2020-05-04", str(grd_path), True,
+        base_url=imd_server.url, geotiff_path=str(tif_path),
+        sink=lambda date, grd: seen.append((date, os.path.basename(grd))),
+    )
+    assert sorted(os.listdir(tif_path)) == [
+        "tmin_20200501.tif", "tmin_20200502.tif", "tmin_20200504.tif"
+    ]
+    assert sorted(seen)[0] == (datetime(2020, 5, 1), "tmin_20200501.grd")
+    assert len(seen) == 3
+    cube, _, _ = data.to_array()
+    with rasterio.open(tif_path / "tmin_20200504.tif") as f:
+        assert (f.read(1) == cube[3]).all()
+    cog_path = tmp_path / "cog"
+    cog_path.mkdir()
+    imddaily.get_data(
+        "tmin", "2020-05-04", "2020-05-04", str(grd_path), True,
+        base_url=imd_server.url, geotiff_path=str(cog_path),
+        geotiff_options={"dtype": "float64", "compress": "deflate", "cog": True},
+    )
+    with rasterio.open(cog_path / "tmin_20200504.tif") as f:
+        assert f.dtypes == ("float64",) and f.compression.value == "DEFLATE"
+        assert f.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG"
+        assert (f.read(1) == cube[3]).all()
+
+
+def test_conversion_vrt(imd_server, tmp_path):
+    grd_path, tif_path = tmp_path / "grd", tmp_path / "tif"
+    grd_path.mkdir()
+    tif_path.mkdir()
+    imd_server.missing.add("max02052020.grd")
+    args = ("tmax", "2020-05-01", "2020-05-03", str(grd_path), True)
+    data = imddaily.get_data(*args, base_url=imd_server.url)
+    with pytest.raises(ValueError, match="use single=False"):
+        data.to_geotiff(str(tif_path), True, vrt=True)
+    data.to_geotiff(str(tif_path), vrt=True)
+    vrt = tif_path / "tmax_stack.vrt"
+    cube, _, _ = data.to_array()
+    with rasterio.open(vrt) as f:
+        assert f.count == 3 and f.nodata == data.nodata
+        assert f.descriptions == ("2020-05-01", "2020-05-02", "2020-05-03")
+        assert (f.read() == cube).all()
+        assert (f.read(2) == data.nodata).all()
+    # extending the range keeps the existing bands and adds the new days
+    longer = imddaily.get_data("tmax", "2020-04-30", "2020-05-04", str(grd_path), True, base_url=imd_server.url)
+    longer.to_geotiff(str(tif_path))
+    assert longer.to_vrt(str(tif_path)) == str(vrt)
+    with open(vrt) as f:
+        assert f.read().count("<ComplexSource>") == 4
+    with rasterio.open(vrt) as f:
+        assert f.count == 5 and f.descriptions[0] == "2020-04-30"
+        assert (f.read() == longer.to_array()[0]).all()
+    assert longer.to_vrt(str(tmp_path), tif_path=str(tif_path)) == str(tmp_path / "tmax_stack.vrt")
+    with rasterio.open(tmp_path / "tmax_stack.vrt") as f:
+        assert (f.read(5) == longer.to_array()[0][4]).all()
+
+
+def test_conversion_bigtiff_profile():
+    imd = IMD("tmax")
+    band = 61 * 61 * 4
+    limit = 2**32 - 2**26
+    assert "BIGTIFF" not in imd._output_profile(limit // band)
+    assert imd._output_profile(limit // band + 1)["BIGTIFF"] == "YES"
+    assert imd._output_profile(limit // band // 2 + 1, "float64")["BIGTIFF"] == "YES"
+
+
+def test_conversion_single_missing_day(imd_server, tmp_path):
+    imd_server.missing.add("max02052020.grd")
+    data = imddaily.get_data(
+        "tmax", "2020-05-01", "2020-05-03", str(tmp_path), True,
+        base_url=imd_server.url,
+    )
+    data.to_geotiff(str(tmp_path), True)
+    with rasterio.open(os.path.join(tmp_path, "tmax_20200501_20200503.tif")) as f:
+        assert f.count == 3
+        assert (f.read(2) == data.nodata).all()
+        for band, name in ((1, "max01052020.grd"), (3, "max03052020.grd")):
+            grid = imd_server.grid("max", name).reshape(61, 61)[::-1]
+            assert (f.read(band) == grid).all()
+
+
+def test_pipeline_in_flight():
+    imd = IMD("tmax")
+    started = []
+
+    def func(batch):
+        started.append(batch)
+        return batch
+
+    for workers, max_items, cap in ((8, None, 16), (8, 8, 2), (8, 2, 1)):
+        started.clear()
+        results = imd._pipeline(func, range(100), workers, 4, max_items)
+        for done, batch in enumerate(results):
+            assert len(started) - (done + 1) <= cap
+        assert [i for b in started for i in b] == list(range(100))
@@ -1,5 +1,8 @@
 from imddaily import imddaily
-import os, pytest
+from imddaily.cache import Cache
+from imddaily.metrics import Recorder
+import os, pytest, subprocess, sys, threading, time
+import numpy as np
 from datetime import datetime
 from datetime import timedelta as td
 
@@ -58,3 +61,301 @@ def test_download_skipped():
     assert not os.path.isfile(os.path.join(testpath, "rain_20200624.grd"))
     assert len(data.skipped_downloads) == 1
     assert "2020-06-24" in data.skipped_downloads
+
+
+def test_download_retry_transient(imd_server, tmp_path):
+    imd_server.flaky["rain_ind0.25_20_06_02.grd"] = 2
+    data = imddaily.get_data(
+        "rain", "2020-06-01", "2020-06-03", str(tmp_path), True,
+        backoff=0, base_url=imd_server.url,
+    )
+    assert data.skipped_downloads == []
+    assert imd_server.hits["rain_ind0.25_20_06_02.grd"] == 3
+    assert os.path.isfile(os.path.join(tmp_path, "rain_20200602.grd"))
+
+
+def test_download_not_found_not_retried(imd_server, tmp_path):
+    imd_server.missing.add("rain_ind0.25_20_06_02.grd")
+    imd_server.flaky["rain_ind0.25_20_06_03.grd"] = 10
+    data = imddaily.get_data(
+        "rain", "2020-06-01", "2020-06-03", str(tmp_path), True,
+        retries=1, backoff=0, base_url=imd_server.url,
+    )
+    assert imd_server.hits["rain_ind0.25_20_06_02.grd"] == 1
+    assert sorted(data.skipped_downloads) == ["2020-06-02", "2020-06-03"]
+    assert data.failed_downloads == ["2020-06-03"]
+
+
+def test_download_async_engine(imd_server, tmp_path):
+    imd_server.missing.add("max01072020.grd")
+    imd_server.latency = 0.05
+    data = imddaily.get_data(
+        "tmax", "2020-06-25", "2020-07-04", str(tmp_path), True,
+        base_url=imd_server.url, engine="async", max_in_flight=3,
+    )
+    assert data.total_days == 10
+    assert data.skipped_downloads == ["2020-07-01"]
+    assert data.failed_downloads == []
+    assert len(os.listdir(tmp_path)) == 9
+    assert 1 < imd_server.peak <= 3
+
+    # 10 requests at 20 per second start over at least 9 intervals of 50 ms
+    imd_server.latency = 0.0
+    start = time.perf_counter()
+    imddaily.get_data(
+        "tmax", "2020-06-25", "2020-07-04", str(tmp_path), True,
+        base_url=imd_server.url, engine="async", max_in_flight=10, rate_limit=20,
+    )
+    assert time.perf_counter() - start >= 0.45
+
+
+def test_download_engine_invalid(tmp_path):
+    with pytest.raises(ValueError, match="engine is not available"):
+        imddaily.get_data("tmax", "2020-06-25", None, str(tmp_path), engine="x")
+
+
+def test_download_resume(imd_server, tmp_path):
+    args = ("tmin", "2020-06-01", "2020-06-05", str(tmp_path), True)
+    imddaily.get_data(*args, base_url=imd_server.url, resume=True)
+    assert sum(imd_server.sent.values()) == 5
+    truncated = os.path.join(tmp_path, "tmin_20200603.grd")
+    with open(truncated, "r+b") as f:
+        f.truncate(100)
+    imddaily.get_data(*args, base_url=imd_server.url, resume=True)
+    assert sum(imd_server.sent.values()) == 6
+    assert os.path.getsize(truncated) == 61 * 61 * 4
+    imd_server.version += 1
+    data = imddaily.get_data(*args, base_url=imd_server.url, resume=True)
+    assert sum(imd_server.sent.values()) == 11
+    # the resumed data converts offline like a fresh download
+    data.to_geotiff(str(tmp_path))
+    data.to_geotiff(str(tmp_path), True)
+    assert os.path.isfile(os.path.join(tmp_path, "tmin_20200603.tif"))
+    assert os.path.isfile(os.path.join(tmp_path, "tmin_20200601_20200605.tif"))
+
+
+def test_download_truncated_not_written(imd_server, tmp_path):
+    imd_server.short.add("min1_02062020.grd")
+    data = imddaily.get_data(
+        "tminone", "2020-06-01", "2020-06-02", str(tmp_path), True,
+        base_url=imd_server.url,
+    )
+    assert data.failed_downloads == ["2020-06-02"]
+    assert sorted(os.listdir(tmp_path)) == ["tmin1_20200601.grd"]
+
+
+def test_download_batch(imd_server, tmp_path):
+    with imddaily.get_batch(
+        ["rain", "tmax", "tmaxone"], "2018-12-30", "2018-12-31", str(tmp_path), True,
+        pool_size=4, base_url=imd_server.url,
+    ) as batch:
+        assert sorted(batch.data) == ["rain", "tmax"]
+        assert "Data available after 2019-01-01" in str(batch.errors["tmaxone"])
+        assert batch.skipped_downloads == {"rain": [], "tmax": []}
+        batch.to_geotiff(str(tmp_path))
+    (tmp_path / "after").mkdir()
+    with pytest.raises(RuntimeError):
+        batch.executor.submit(print)
+    # the data of each parameter keeps working with its own pool and session
+    batch["tmax"].fetch()
+    batch["tmax"].to_geotiff(str(tmp_path / "after"), single=True)
+    assert os.path.isfile(os.path.join(tmp_path, "tmax_20181231.tif"))
+    assert os.path.isfile(os.path.join(tmp_path, "rain_20181230.tif"))
+    with pytest.raises(ValueError, match="is not available in IMD"):
+        imddaily.get_batch(["rain", "snow"], "2020-01-01", None, str(tmp_path))
+
+
+def test_download_deferred(imd_server, tmp_path):
+    data = imddaily.get_data(
+        "rain", "2020-06-01", "2020-06-03", str(tmp_path), True,
+        base_url=imd_server.url, download=False,
+    )
+    assert imd_server.hits == {}
+    assert data.skipped_downloads == ["2020-06-01", "2020-06-02", "2020-06-03"]
+    assert data.px_size == "0.25 degree(s)"
+    assert data.fetch() is data
+    assert data.skipped_downloads == []
+    assert len(imd_server.hits) == 3
+
+
+def test_import_is_lazy():
+    heavy = ("rasterio", "requests", "tqdm", "asyncio", "concurrent.futures.thread")
+    code = f"import sys, imddaily.imddaily; print([m for m in {heavy} if m in sys.modules])"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_download_catalog(imd_server, tmp_path):
+    imd_server.missing.add("rain_ind0.25_20_06_02.grd")
+    data = imddaily.get_data(
+        "rain", "2020-06-01", "2020-06-04", str(tmp_path), True,
+        base_url=imd_server.url, download=False,
+    )
+    assert data.available_dates() == ["2020-06-01", "2020-06-03", "2020-06-04"]
+    assert len(imd_server.heads) == 4 and imd_server.hits == {}
+    assert os.path.isfile(os.path.join(tmp_path, "rain_catalog.json"))
+
+    # the unpublished day is skipped without a request, a new day is recorded
+    data = imddaily.get_data(
+        "rain", "2020-06-01", "2020-06-05", str(tmp_path), True,
+        base_url=imd_server.url, catalog=True,
+    )
+    assert data.skipped_downloads == ["2020-06-02"]
+    assert "rain_ind0.25_20_06_02.grd" not in imd_server.hits
+    assert data.catalog.status(datetime(2020, 6, 5)) is True
+
+    # once expired the unpublished day is requested again
+    imd_server.missing.clear()
+    data = imddaily.get_data(
+        "rain", "2020-06-02", "2020-06-02", str(tmp_path), True,
+        base_url=imd_server.url, catalog=True, catalog_ttl=0,
+    )
+    assert data.skipped_downloads == []
+    assert data.available_dates() == ["2020-06-02"]
+    assert len(imd_server.heads) == 4
+
+
+def test_download_archive(imd_server, tmp_path):
+    grd_dir, arc_dir = tmp_path / "grd", tmp_path / "arc"
+    grd_dir.mkdir(), arc_dir.mkdir()
+    args = ("tmax", "2020-06-01", "2020-06-04")
+    grd = imddaily.get_data(*args, str(grd_dir), True, base_url=imd_server.url)
+    data = imddaily.get_data(
+        "tmax", "2020-06-03", "2020-06-04", str(arc_dir), True,
+        base_url=imd_server.url, archive=True, resume=True,
+    )
+    assert sorted(os.listdir(arc_dir)) == ["tmax_archive.bin", "tmax_archive.idx", "tmax_manifest.json"]
+    # earlier days are appended to the archive and indexed by date
+    data = imddaily.get_data(*args, str(arc_dir), True, base_url=imd_server.url, archive=True, resume=True)
+    assert data.skipped_downloads == []
+    assert os.path.getsize(arc_dir / "tmax_archive.bin") == 4 * 61 * 61 * 4
+    assert [f"{d:%d}" for d in data.archive.dates()] == ["01", "02", "03", "04"]
+    assert {data.archive.slot(datetime(2020, 6, d)) for d in (1, 2)} == {2, 3}
+    np.testing.assert_array_equal(data.to_array()[0], grd.to_array()[0])
+    # resume finds the days in the archive, revised days are appended to new
+    # slots and the earlier grids stay unchanged for readers of the map
+    assert imddaily.get_data(*args, str(arc_dir), True, archive=True, download=False).skipped_downloads == []
+    # without resume the days in the archive are not downloaded again
+    imd_server.sent.clear()
+    imddaily.get_data(*args, str(arc_dir), True, base_url=imd_server.url, archive=True)
+    assert imd_server.sent == {} and os.path.getsize(arc_dir / "tmax_archive.bin") == 4 * 61 * 61 * 4
+    before = np.array(np.memmap(arc_dir / "tmax_archive.bin", "float32", mode="r"))
+    imd_server.version += 1
+    revised = imddaily.get_data(*args, str(arc_dir), True, base_url=imd_server.url, archive=True, resume=True)
+    assert os.path.getsize(arc_dir / "tmax_archive.bin") == 8 * 61 * 61 * 4
+    after = np.memmap(arc_dir / "tmax_archive.bin", "float32", mode="r")
+    np.testing.assert_array_equal(after[: before.size], before)
+    reopened = imddaily.get_data(*args, str(arc_dir), True, archive=True, download=False)
+    assert {reopened.archive.slot(datetime(2020, 6, d)) for d in range(1, 5)} == {4, 5, 6, 7}
+    np.testing.assert_array_equal(revised.to_array()[0], grd.to_array()[0])
+    data.to_geotiff(str(tmp_path))
+    assert os.path.isfile(tmp_path / "tmax_20200601.tif")
+
+
+def test_download_archive_sink_error(imd_server, tmp_path):
+    def sink(date, path):
+        raise RuntimeError("sink failed")
+
+    args = ("tmax", "2020-06-01", "2020-06-04", str(tmp_path), True)
+    with pytest.raises(RuntimeError, match="sink failed"):
+        imddaily.get_data(*args, base_url=imd_server.url, archive=True, sink=sink)
+    # the index of the downloaded days is saved although the sink failed
+    assert imddaily.get_data(*args, archive=True, download=False).skipped_downloads == []
+
+
+def set_times(path, name, seconds):
+    """set the download and last use time of a cached file"""
+    os.utime(path / name, (seconds, seconds))
+    os.utime(path / ".locks" / f"{name}.lock", (seconds, seconds))
+
+
+def test_download_shared_cache(imd_server, tmp_path):
+    args = ("tmaxone", "2020-06-01", "2020-06-06", str(tmp_path), True)
+    jobs = [
+        threading.Thread(target=imddaily.get_data, args=args, kwargs={"base_url": imd_server.url, "cache": True})
+        for _ in range(4)
+    ]
+    for job in jobs:
+        job.start()
+    for job in jobs:
+        job.join()
+    # each file is downloaded once, the other jobs wait for it and reuse it
+    assert sum(imd_server.sent.values()) == 6
+    with pytest.raises(ValueError, match="cannot be combined"):
+        imddaily.get_data(*args, cache=True, archive=True)
+
+    # the oldest files outside the range are evicted to fit max_bytes
+    day = 31 * 31 * 4
+    for i, name in enumerate(sorted(os.listdir(tmp_path))[1:]):
+        set_times(tmp_path, name, 1e9 + i)
+    data = imddaily.get_data(
+        "tmaxone", "2020-06-05", "2020-06-07", str(tmp_path), True,
+        base_url=imd_server.url, cache=True, cache_max_bytes=4 * day, cache_grace=0,
+    )
+    assert sum(imd_server.sent.values()) == 7
+    grd = sorted(f for f in os.listdir(tmp_path) if f.endswith(".grd"))
+    assert grd == ["tmax1_20200604.grd", "tmax1_20200605.grd", "tmax1_20200606.grd", "tmax1_20200607.grd"]
+    # files locked by a download are not evicted
+    for i, name in enumerate(grd):
+        set_times(tmp_path, name, 1e9 + i)
+    with data.cache.lock("tmax1_20200604.grd"):
+        removed = Cache(str(tmp_path), max_bytes=2 * day, grace=0).evict()
+    assert [os.path.basename(p) for p in removed] == grd[1:3]
+    # expired files are downloaded again
+    imddaily.get_data("tmaxone", "2020-06-07", "2020-06-07", str(tmp_path), True, base_url=imd_server.url, cache=True)
+    assert sum(imd_server.sent.values()) == 7
+    imddaily.get_data(
+        "tmaxone", "2020-06-07", "2020-06-07", str(tmp_path), True,
+        base_url=imd_server.url, cache=True, cache_max_age=0, cache_grace=0,
+    )
+    assert sum(imd_server.sent.values()) == 8
+    assert sorted(os.listdir(tmp_path)) == [".locks", "tmax1_20200607.grd"]
+
+
+def test_download_cache_eviction_in_use(imd_server, tmp_path):
+    day = 31 * 31 * 4
+    kwargs = {"base_url": imd_server.url, "cache": True}
+    a = imddaily.get_data("tmaxone", "2020-05-01", "2020-05-03", str(tmp_path), True, **kwargs)
+    # the days job a fetched are in use, another job does not evict them
+    imddaily.get_data("tmaxone", "2020-05-04", "2020-05-06", str(tmp_path), True, cache_max_bytes=3 * day, **kwargs)
+    cube, _, _ = a.to_array()
+    assert not (cube == np.float32(99.9)).all(axis=(1, 2)).any()
+    # files being read are not evicted, the least recently used files are
+    # evicted with their lock files
+    for d in range(1, 7):
+        set_times(tmp_path, f"tmax1_2020050{d}.grd", 1e9 + d)
+    os.utime(tmp_path / ".locks" / "tmax1_20200502.grd.lock", (1e9 + 10, 1e9 + 10))
+    with a.cache.lock("tmax1_20200501.grd", shared=True):
+        removed = Cache(str(tmp_path), max_bytes=3 * day, grace=0).evict()
+    assert [os.path.basename(p) for p in removed] == [f"tmax1_2020050{d}.grd" for d in (3, 4, 5)]
+    assert sorted(os.listdir(tmp_path / ".locks")) == [f"tmax1_2020050{d}.grd.lock" for d in (1, 2, 6)]
+    # days evicted after the grace period are reported, not read as no data
+    with pytest.raises(FileNotFoundError, match="tmax1_20200503.grd was evicted"):
+        a.to_array()
+    a.fetch()
+    np.testing.assert_array_equal(a.to_array()[0], cube)
+
+
+def test_download_cache_hit_events(imd_server, tmp_path):
+    args = ("tmaxone", "2020-05-01", "2020-05-03", str(tmp_path), True)
+    imddaily.get_data(*args, base_url=imd_server.url, cache=True)
+    rec = Recorder()
+    imddaily.get_data(*args, base_url=imd_server.url, cache=True, metrics=rec)
+    # days reused from the cache are reported as fetched without a request
+    assert sum(imd_server.sent.values()) == 3
+    fetch = [e for e in rec.events if e.stage == "fetch"]
+    assert len(fetch) == 3
+    assert all(e.cached and e.status is None and e.error is None for e in fetch)
+    assert rec.summary()["fetch"]["cached"] == 3
+
+
+def test_download_file_mode(imd_server, tmp_path):
+    umask = os.umask(0o022)
+    os.umask(umask)
+    data = imddaily.get_data(
+        "tminone", "2020-06-01", "2020-06-01", str(tmp_path), True,
+        base_url=imd_server.url, resume=True, catalog=True,
+    )
+    data.to_vrt(str(tmp_path))
+    for name in ("tmin1_20200601.grd", "tmin1_manifest.json", "tmin1_catalog.json", "tmin1_stack.vrt"):
+        assert os.stat(tmp_path / name).st_mode & 0o777 == 0o666 & ~umask
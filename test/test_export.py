@@ -0,0 +1,85 @@
+from imddaily import imddaily
+import os, pytest
+import numpy as np
+
+
+def get(server, path, start, end):
+    return imddaily.get_data(
+        "tmaxone", start, end, str(path), True, base_url=server.url
+    )
+
+
+def test_to_zarr_append(imd_server, tmp_path):
+    zarr = pytest.importorskip("zarr")
+    store = os.path.join(tmp_path, "tmax1.zarr")
+    first = get(imd_server, tmp_path, "2020-05-01", "2020-05-03")
+    first.to_zarr(store, chunks=(2, 31, 31))
+    later = get(imd_server, tmp_path, "2020-05-03", "2020-05-06")
+    later.to_zarr(store, chunks=(2, 31, 31))
+    group = zarr.open_group(store, mode="r")
+    assert group["tmaxone"].shape == (6, 31, 31)
+    assert list(group["time"][:]) == list(range(18383, 18389))
+    cube, lats, _ = later.to_array()
+    assert (group["tmaxone"][2:] == cube).all()
+    assert (group["lat"][:] == lats).all()
+    with pytest.raises(ValueError, match="earlier days cannot be appended"):
+        get(imd_server, tmp_path, "2020-04-30", "2020-04-30").to_zarr(store)
+
+
+def test_to_netcdf_append(imd_server, tmp_path):
+    netCDF4 = pytest.importorskip("netCDF4")
+    path = os.path.join(tmp_path, "tmax1.nc")
+    get(imd_server, tmp_path, "2020-05-01", "2020-05-02").to_netcdf(path)
+    later = get(imd_server, tmp_path, "2020-05-04", "2020-05-05")
+    later.to_netcdf(path)
+    with netCDF4.Dataset(path) as ds:
+        var = ds["tmaxone"]
+        var.set_auto_mask(False)
+        assert var.shape == (5, 31, 31)
+        assert list(ds["time"][:]) == list(range(18383, 18388))
+        assert (var[2] == np.float32(99.9)).all()
+        assert (var[3:] == later.to_array()[0]).all()
+        assert var.units == "degree C"
+
+
+def test_extract_points(imd_server, tmp_path):
+    imd_server.missing.add("max1_02052020.grd")
+    data = get(imd_server, tmp_path, "2020-05-01", "2020-05-03")
+    cube, lats, lons = data.to_array()
+    dates, values = data.extract_points([37.5, 20.2, 0.0], [67.5, 80.1, 80.0])
+    assert len(dates) == 3 and values.shape == (3, 3)
+    assert (values[:, 0] == cube[:, 0, 0]).all()
+    assert (values[:, 1] == cube[:, 17, 13]).all()
+    assert (values[:, 2] == np.float32(99.9)).all()
+    _, bilinear = data.extract_points([20.5, 20.5], [80.0, 80.5], "bilinear")
+    expected = (cube[0, 17, 12] + cube[0, 17, 13]) / 2
+    assert bilinear[0, 0] == pytest.approx(expected)
+    assert bilinear[0, 1] == cube[0, 17, 13]
+    assert (bilinear[1] == np.float32(99.9)).all()
+
+
+def test_zonal_stats(imd_server, tmp_path):
+    data = get(imd_server, tmp_path, "2020-05-01", "2020-05-02")
+    cube, _, _ = data.to_array()
+    # pixel centred on 20.5N 80.5E (row 17, col 13) and half of the pixel east of it
+    box = {
+        "type": "Polygon",
+        "coordinates": [[(80.0, 20.0), (81.5, 20.0), (81.5, 21.0), (80.0, 21.0), (80.0, 20.0)]],
+    }
+    outside = {
+        "type": "Polygon",
+        "coordinates": [[(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0), (0.0, 0.0)]],
+    }
+    stats = ("mean", "weighted_mean", "sum", "min", "max")
+    dates, out = data.zonal_stats([box, outside], stats, cache_dir=str(tmp_path))
+    a, b = cube[:, 17, 13], cube[:, 17, 14]
+    assert len(dates) == 2
+    assert out["mean"][:, 0] == pytest.approx((a + b) / 2)
+    assert out["weighted_mean"][:, 0] == pytest.approx((a + b / 2) / 1.5)
+    assert out["sum"][:, 0] == pytest.approx(a + b / 2)
+    assert (out["min"][:, 0] == np.minimum(a, b)).all()
+    assert (out["max"][:, 0] == np.maximum(a, b)).all()
+    assert (out["mean"][:, 1] == np.float32(99.9)).all()
+    assert any(f.startswith("zonal_") for f in os.listdir(tmp_path))
+    _, cached = data.zonal_stats([box, outside], stats, cache_dir=str(tmp_path))
+    assert (cached["sum"] == out["sum"]).all()
@@ -0,0 +1,67 @@
+from imddaily import imddaily, indices
+from imddaily.indices import RunLength
+import numpy as np
+import pytest
+
+
+def naive_runs(cond, min_length):
+    longest = count = days = run = 0
+    for c in cond:
+        run = run + 1 if c else 0
+        longest = max(longest, run)
+        count += run == min_length
+        days += min_length if run == min_length else run > min_length
+    return longest, count, days
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 100])
+def test_run_length_matches_loop(chunk):
+    rng = np.random.default_rng(1)
+    cond = rng.random((100, 4, 5)) < 0.6
+    runs = RunLength((4, 5), min_length=3)
+    for i in range(0, 100, chunk):
+        runs.update(cond[i : i + chunk])
+    for r in range(4):
+        for c in range(5):
+            expected = naive_runs(cond[:, r, c], 3)
+            assert (runs.longest[r, c], runs.count[r, c], runs.days[r, c]) == expected
+
+
+@pytest.fixture
+def tmax(imd_server, tmp_path):
+    return imddaily.get_data(
+        "tmax", "2020-06-01", "2020-07-31", str(tmp_path), True, base_url=imd_server.url
+    )
+
+
+def test_indices_spells_and_gdd(imd_server, tmp_path, tmax):
+    cube, _, _ = tmax.to_array()
+    nodata = np.float32(tmax.nodata)
+    cond = (cube >= 40) & (cube != nodata)
+    monthly = dict(indices.heatwaves(tmax, 40.0, min_length=2, stat="days", freq="M", chunk=9))
+    assert list(monthly) == ["202006", "202007"]
+    expected = np.apply_along_axis(lambda c: naive_runs(c, 2)[2], 0, cond[:30])
+    assert np.array_equal(monthly["202006"], expected.astype("float32"))
+
+    tmin = imddaily.get_data(
+        "tmin", "2020-06-01", "2020-07-31", str(tmp_path), True, base_url=imd_server.url
+    )
+    (label, gdd), = indices.growing_degree_days(tmax, tmin, base=20.0, upper=40.0)
+    tn, _, _ = tmin.to_array()
+    mean = np.minimum((cube + tn) / 2, 40.0)
+    assert label == "2020"
+    assert np.allclose(gdd, np.maximum(mean - 20.0, 0).sum(axis=0), rtol=1e-5)
+
+
+@pytest.mark.filterwarnings("ignore:All-NaN slice")
+def test_indices_percentile(tmax):
+    cube, _, _ = tmax.to_array()
+    q = indices.percentile(tmax, [50, 90], min_value=30.0, rows=7)
+    masked = np.where(cube >= 30.0, cube, np.nan)
+    assert q.shape == (2, *cube.shape[1:])
+    expected = np.nanpercentile(masked, [50, 90], axis=0)
+    assert np.isnan(expected).any()
+    expected = np.where(np.isnan(expected), np.float32(99.9), expected)
+    assert np.allclose(q, expected, atol=1e-4)
+    days = dict(indices.spells(tmax, q[1], stat="days", freq="Y"))["2020"]
+    assert np.array_equal(days, (cube >= q[1]).sum(axis=0).astype("float32"))
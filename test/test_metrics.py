@@ -0,0 +1,58 @@
+from imddaily import imddaily
+from imddaily.metrics import Callback, Recorder
+import json, os
+
+
+def test_metrics_download_and_conversion(imd_server, tmp_path):
+    imd_server.flaky["rain_ind0.25_20_06_02.grd"] = 2
+    imd_server.missing.add("rain_ind0.25_20_06_03.grd")
+    imd_server.short.add("rain_ind0.25_20_06_04.grd")
+    rec = Recorder()
+    data = imddaily.get_data(
+        "rain", "2020-06-01", "2020-06-05", str(tmp_path), True,
+        retries=2, backoff=0, base_url=imd_server.url, metrics=rec,
+    )
+    fetch = {f"{e.date:%d}": e for e in rec.events if e.stage == "fetch"}
+    assert sorted(fetch) == ["01", "02", "03", "04", "05"]
+    assert fetch["02"].retries == 2 and fetch["02"].error is None
+    assert fetch["03"].status == 404 and fetch["03"].error == "HTTP 404"
+    assert fetch["04"].error == "truncated" and fetch["04"].nbytes == 100
+    grd_size = 129 * 135 * 4
+    assert fetch["05"].nbytes == grd_size and fetch["05"].status == 200
+    summary = rec.summary()
+    assert summary["fetch"]["retries"] == 2
+    assert summary["fetch"]["errors"] == {"HTTP 404": 1, "truncated": 1}
+    assert summary["write"]["count"] == 4
+    assert summary["fetch"]["bytes"] == 3 * grd_size + 100
+
+    rec.events.clear()
+    tif = tmp_path / "tif"
+    tif.mkdir()
+    data.to_geotiff(str(tif), dtype="int16")
+    assert {s: v["count"] for s, v in rec.summary().items()} == {
+        "read": 3, "transform": 3, "geotiff": 3,
+    }
+    assert rec.summary()["geotiff"]["bytes"] == 3 * 129 * 135 * 2
+    out = tmp_path / "metrics.jsonl"
+    rec.to_jsonl(str(out))
+    assert json.loads(out.read_text().splitlines()[0])["stage"] == "read"
+
+
+def test_metrics_callback_single(imd_server, tmp_path):
+    events = []
+    data = imddaily.get_data(
+        "tmax", "2020-06-01", "2020-06-03", str(tmp_path), True,
+        base_url=imd_server.url, metrics=Callback(events.append),
+    )
+    events.clear()
+    data.to_geotiff(str(tmp_path), single=True)
+    assert [e.stage for e in events if e.stage == "geotiff"] == ["geotiff"] * 3
+    assert os.path.isfile(tmp_path / "tmax_20200601_20200603.tif")
+
+
+def test_metrics_without_download(imd_server, tmp_path):
+    imddaily.get_data("tmaxone", "2020-06-01", "2020-06-02", str(tmp_path), True, base_url=imd_server.url)
+    rec = Recorder()
+    data = imddaily.get_data("tmaxone", "2020-06-01", "2020-06-02", str(tmp_path), True, download=False, metrics=rec)
+    data.to_array()
+    assert {s: v["count"] for s, v in rec.summary().items()} == {"read": 2, "transform": 2}
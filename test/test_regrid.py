@@ -0,0 +1,53 @@
+from imddaily import imddaily
+from imddaily.regrid import Weights, coords
+import numpy as np
+import os, pytest
+
+lats, lons = np.arange(30.0, 9.9, -0.5), np.arange(70.0, 90.1, 0.5)
+
+
+def test_regrid_nearest_identity():
+    w = Weights.build("nearest", lats, lons, lats, lons)
+    grid = np.random.default_rng(0).random((3, len(lats), len(lons))).astype("float32")
+    assert np.array_equal(w.apply(grid, -999.0), grid)
+
+
+def test_regrid_bilinear_linear_field():
+    field = (2 * lats[:, None] + 3 * lons[None]).astype("float32")
+    dst_lats, dst_lons = np.arange(29.3, 10.0, -1.1), np.arange(70.2, 90.0, 0.7)
+    out = Weights.build("bilinear", lats, lons, dst_lats, dst_lons).apply(field, -999.0)
+    assert np.allclose(out, 2 * dst_lats[:, None] + 3 * dst_lons[None], atol=1e-3)
+    outside = Weights.build("bilinear", lats, lons, [40.0], [80.0]).apply(field, -999.0)
+    assert outside[0, 0] == np.float32(-999.0)
+
+
+def test_regrid_conservative_area_mean_and_nodata():
+    field = np.random.default_rng(1).random((len(lats), len(lons))).astype("float32")
+    field[0, 0] = 99.9
+    # 1 degree cells whose edges fall on the 0.5 degree edges
+    dst_lats, dst_lons = np.arange(29.75, 10.0, -1.0), np.arange(70.25, 89.0, 1.0)
+    out = Weights.build("conservative", lats, lons, dst_lats, dst_lons).apply(field, 99.9)
+    r, c = 3, 5
+    rows, cols = slice(2 * r, 2 * r + 2), slice(2 * c, 2 * c + 2)
+    edges = np.radians(30.25 - 0.5 * np.arange(2 * r, 2 * r + 3))
+    area = -np.diff(np.sin(edges))
+    expected = (field[rows, cols] * area[:, None]).sum() / (2 * area.sum())
+    assert out[r, c] == pytest.approx(expected, rel=1e-5)
+    # the no data pixel is left out of the first cell
+    a0, a1 = -np.diff(np.sin(np.radians([30.25, 29.75, 29.25])))
+    expected = (field[0, 1] * a0 + (field[1, 0] + field[1, 1]) * a1) / (a0 + 2 * a1)
+    assert out[0, 0] == pytest.approx(expected, rel=1e-5)
+
+
+def test_regrid_get_data_cached(imd_server, tmp_path):
+    data = imddaily.get_data(
+        "rain", "2020-06-01", "2020-06-03", str(tmp_path), True, base_url=imd_server.url
+    )
+    first = list(data.regrid("tmax", "conservative", cache_dir=str(tmp_path), batch_size=2))
+    assert [f"{d:%d}" for d, _ in first] == ["01", "02", "03"]
+    assert first[0][1].shape == (61, 61)
+    assert len([f for f in os.listdir(tmp_path) if f.startswith("regrid_")]) == 1
+    again = list(data.regrid(coords("tmax"), "conservative", cache_dir=str(tmp_path)))
+    assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(first, again))
+    with pytest.raises(ValueError):
+        next(data.regrid("tmax", "cubic"))